@@ -0,0 +1,299 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import openpyxl
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Rough in-memory cost of one DataFrame cell (object column value + pointer)
+BYTES_PER_CELL = 100
+# Peak cost of one cell while openpyxl parses a sheet (read_excel) or builds
+# a workbook in memory (ExcelWriter export and format_excel_output reload)
+OPENPYXL_BYTES_PER_CELL = 500
+# Uncompressed size of an xlsx relative to the file on disk
+XLSX_EXPANSION = 10
+# Rows of each file read with pandas to discover a key in the merge engine
+KEY_SAMPLE_ROWS = 1000
+# Seconds between admission checks while a job waits in the queue
+POLL_INTERVAL = 0.05
+
+
+class AdmissionRejected(Exception):
+    """Raised when a job cannot be admitted within the memory budget"""
+
+
+def sniff_dimensions(file_path):
+    """
+    Read the row and column count of the first sheet without loading it
+
+    Returns:
+        tuple: (rows, columns), or (None, None) if the sheet has no
+            recorded dimensions or the file cannot be opened in streaming mode
+    """
+    if Path(file_path).suffix.lower() != '.xlsx':
+        return None, None
+    try:
+        wb = openpyxl.load_workbook(file_path, read_only=True)
+    except Exception:
+        return None, None
+    try:
+        ws = wb.worksheets[0]
+        return ws.max_row, ws.max_column
+    except Exception:
+        return None, None
+    finally:
+        wb.close()
+
+
+def estimate_job_memory(file_paths, chunk_rows=100000):
+    """
+    Estimate peak memory for comparing the given files
+
+    The hash engine keeps the raw and cleaned base frame for the whole job
+    and the result slices of every comparison file until export. Each
+    comparison file adds its raw and cleaned frames plus the openpyxl parse
+    while it is read, and the export builds every result cell in openpyxl.
+    Every base row ends up in either the matched or the missing sheet and
+    every comparison row in the matched or extra sheet, so the results of
+    one comparison file hold about base + comparison cells.
+
+    The merge engine streams both files and spills results to disk, so it
+    only needs the external sort buffers and the key discovery samples.
+
+    Args:
+        file_paths (list): Base file followed by the comparison files
+        chunk_rows (int): Rows buffered per side by the streaming engine
+
+    Returns:
+        dict: 'bytes' for the in-memory (hash) engine, 'chunked_bytes' for
+            the streaming (merge) engine, plus the sniffed 'cells'
+    """
+    sizes = []
+    widest = 0
+    longest = 0
+    for file_path in file_paths:
+        size_estimate = os.path.getsize(file_path) * XLSX_EXPANSION
+        rows, columns = sniff_dimensions(file_path)
+        if rows and columns:
+            # Writers may record a placeholder such as <dimension ref="A1"/>,
+            # so never estimate below what the file size implies
+            cells = max(rows * columns, size_estimate // BYTES_PER_CELL)
+            widest = max(widest, columns)
+            longest = max(longest, cells // columns)
+        else:
+            cells = size_estimate // BYTES_PER_CELL
+            longest = max(longest, chunk_rows)
+        sizes.append(cells)
+
+    base_cells, comp_cells = sizes[0], sizes[1:]
+    result_cells = sum(base_cells + cells for cells in comp_cells)
+    reading = max(
+        [cells * (2 * BYTES_PER_CELL + OPENPYXL_BYTES_PER_CELL) for cells in comp_cells], default=0
+    )
+    in_memory = (
+        base_cells * 2 * BYTES_PER_CELL
+        + result_cells * BYTES_PER_CELL
+        + max(reading, result_cells * OPENPYXL_BYTES_PER_CELL)
+    )
+
+    widest = max(widest, 1)
+    chunked = (
+        2 * min(chunk_rows, longest) * widest * BYTES_PER_CELL
+        + 2 * min(KEY_SAMPLE_ROWS, longest) * widest * (BYTES_PER_CELL + OPENPYXL_BYTES_PER_CELL)
+    )
+
+    return {
+        'bytes': in_memory,
+        'chunked_bytes': chunked,
+        'cells': sum(sizes),
+    }
+
+
+def current_rss():
+    """Resident memory of this process in bytes, or None if unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # Peak rather than current on platforms without /proc
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def available_memory():
+    """Memory the system can hand out without swapping, in bytes, or None if unknown"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AdmissionController:
+    def __init__(self, budget_bytes, max_queue=4, queue_timeout=60, chunked_threshold=None,
+                 state_path=None):
+        """
+        Bound the memory used by concurrent comparison jobs
+
+        Reservations and the wait queue live in ``state_path``, a JSON ledger
+        guarded by an flock, so every gunicorn worker on the host shares one
+        budget; entries left by dead processes are dropped. Without a state
+        path (or without fcntl) they are kept in memory and the budget applies
+        per process. A job is also held back while the system reports less
+        available memory than it needs.
+
+        Args:
+            budget_bytes (int): Memory available to running jobs
+            max_queue (int): Jobs allowed to wait for budget before rejecting
+            queue_timeout (float): Seconds a queued job waits before rejecting
+            chunked_threshold (int): Estimated size above which jobs use the
+                streaming engine (optional; by default every job uses the
+                hash engine, whose output keeps the input row order)
+            state_path (str): Ledger file shared by worker processes (optional)
+        """
+        self.budget_bytes = budget_bytes
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.chunked_threshold = chunked_threshold
+        self.state_path = state_path if fcntl is not None else None
+        self._lock = threading.Lock()
+        self._state = {'jobs': {}, 'queued': {}}
+
+    @contextmanager
+    def _shared_state(self):
+        """Lock the reservation ledger and yield it; changes are saved on exit"""
+        if self.state_path is None:
+            with self._lock:
+                yield self._state
+            return
+
+        with open(self.state_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                text = f.read()
+                try:
+                    state = json.loads(text) if text.strip() else {}
+                except ValueError:
+                    state = {}
+                state.setdefault('jobs', {})
+                state.setdefault('queued', {})
+                for section in ('jobs', 'queued'):
+                    for ticket, entry in list(state[section].items()):
+                        if not _pid_alive(entry['pid']):
+                            del state[section][ticket]
+
+                yield state
+
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _fits(self, state, nbytes):
+        in_use = sum(job['bytes'] for job in state['jobs'].values())
+        if in_use + nbytes > self.budget_bytes:
+            return False
+        available = available_memory()
+        return available is None or nbytes <= available
+
+    def plan(self, estimate):
+        """
+        Choose the comparison engine and memory reservation for a job
+
+        Returns:
+            tuple: (engine name for ExcelComparator.compare_files, bytes to reserve)
+        """
+        if self.chunked_threshold is not None and estimate['bytes'] > self.chunked_threshold:
+            return 'merge', estimate['chunked_bytes']
+        return 'hash', estimate['bytes']
+
+    @contextmanager
+    def admit(self, nbytes):
+        """
+        Reserve memory for a job, waiting in the queue if the budget is in use
+
+        Raises:
+            AdmissionRejected: If the job can never fit, the queue is full or
+                the wait times out
+        """
+        if nbytes > self.budget_bytes:
+            raise AdmissionRejected(
+                f'Job needs about {nbytes // (1024 * 1024)} MB, more than the '
+                f'{self.budget_bytes // (1024 * 1024)} MB budget'
+            )
+
+        ticket = f'{os.getpid()}-{uuid.uuid4().hex}'
+        deadline = time.monotonic() + self.queue_timeout
+        queued = False
+        try:
+            while True:
+                with self._shared_state() as state:
+                    if self._fits(state, nbytes):
+                        state['queued'].pop(ticket, None)
+                        state['jobs'][ticket] = {'pid': os.getpid(), 'bytes': nbytes}
+                        break
+                    if not queued:
+                        if len(state['queued']) >= self.max_queue:
+                            raise AdmissionRejected('Too many jobs are waiting, please try again later')
+                        state['queued'][ticket] = {'pid': os.getpid()}
+                        queued = True
+                if time.monotonic() >= deadline:
+                    raise AdmissionRejected('Timed out waiting for memory, please try again later')
+                time.sleep(POLL_INTERVAL)
+        except BaseException:
+            if queued:
+                with self._shared_state() as state:
+                    state['queued'].pop(ticket, None)
+            raise
+
+        try:
+            yield
+        finally:
+            with self._shared_state() as state:
+                state['jobs'].pop(ticket, None)
+
+    def status(self):
+        """Snapshot of reserved memory, running jobs and queue depth"""
+        with self._shared_state() as state:
+            reserved = sum(job['bytes'] for job in state['jobs'].values())
+            active = len(state['jobs'])
+            queued = len(state['queued'])
+        return {
+            'budget_bytes': self.budget_bytes,
+            'reserved_bytes': reserved,
+            'active_jobs': active,
+            'queue_depth': queued,
+            'max_queue': self.max_queue,
+            'available_bytes': available_memory(),
+            'rss_bytes': current_rss(),
+        }
@@ -1,9 +1,15 @@
-from flask import Flask, render_template, request, send_file, flash, redirect, url_for
+from flask import Flask, render_template, request, send_file, flash, redirect, url_for, jsonify
 import os
 from werkzeug.utils import secure_filename
+import shutil
+import uuid
 from pathlib import Path
 import tempfile
 from excelExtractor import ExcelComparator
+from result_cache import ResultCache, prune_directory
+from admission import AdmissionController, AdmissionRejected, estimate_job_memory
+from ingest_cache import IngestCache
+from profiling import RunProfiler
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
@@ -24,12 +30,50 @@ ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
 # app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Cached comparison results, keyed by input file contents and match columns
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 3600))
+RESULT_CACHE_MAX_MB = int(os.environ.get('RESULT_CACHE_MAX_MB', 512))
+result_cache = ResultCache(
+    UPLOAD_FOLDER,
+    ttl_seconds=RESULT_CACHE_TTL,
+    max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024
+)
+
+# Opt-in cache of parsed workbooks as Feather files so re-uploaded files skip
+# read_excel; it keeps copies of uploaded data on disk for INGEST_CACHE_TTL
+ingest_cache = None
+if os.environ.get('ENABLE_INGEST_CACHE', '0') == '1':
+    ingest_cache = IngestCache(
+        os.path.join(UPLOAD_FOLDER, 'ingest'),
+        max_bytes=int(os.environ.get('INGEST_CACHE_MAX_MB', 1024)) * 1024 * 1024,
+        max_age=int(os.environ.get('INGEST_CACHE_TTL', 7 * 24 * 3600))
+    )
+
+# Opt-in profiling of single uploads (form field or query parameter profile=1)
+app.config['PROFILING_ENABLED'] = os.environ.get('ENABLE_PROFILING', '0') == '1'
+PROFILE_FOLDER = os.path.join(UPLOAD_FOLDER, 'profiles')
+os.makedirs(PROFILE_FOLDER, exist_ok=True)
+
+# Memory budget for running comparisons, shared by all worker processes
+# through a ledger file; larger jobs queue. Setting CHUNKED_THRESHOLD_MB opts
+# jobs estimated above it into the streaming engine, which writes result rows
+# sorted by the match key.
+MEMORY_BUDGET_MB = int(os.environ.get('MEMORY_BUDGET_MB', 1024))
+CHUNKED_THRESHOLD_MB = os.environ.get('CHUNKED_THRESHOLD_MB')
+admission = AdmissionController(
+    MEMORY_BUDGET_MB * 1024 * 1024,
+    max_queue=int(os.environ.get('ADMISSION_MAX_QUEUE', 4)),
+    queue_timeout=int(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 60)),
+    chunked_threshold=int(CHUNKED_THRESHOLD_MB) * 1024 * 1024 if CHUNKED_THRESHOLD_MB else None,
+    state_path=os.path.join(UPLOAD_FOLDER, '.admission.json')
+)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', profiling_enabled=app.config['PROFILING_ENABLED'])
 
 @app.route('/upload', methods=['POST'])
 def upload_files():
@@ -48,72 +92,127 @@ def upload_files():
             flash('Invalid file type for base file. Please upload Excel files (.xlsx, .xls)', 'error')
             return redirect(request.url)
         
-        # Save base file
-        base_filename = secure_filename(base_file.filename)
-        base_filepath = os.path.join(app.config['UPLOAD_FOLDER'], base_filename)
-        base_file.save(base_filepath)
-        
-        # Get comparison files
-        comparison_files = request.files.getlist('comparison_files')
-        comparison_filepaths = []
-        
-        for comp_file in comparison_files:
-            if comp_file.filename != '' and allowed_file(comp_file.filename):
-                comp_filename = secure_filename(comp_file.filename)
-                comp_filepath = os.path.join(app.config['UPLOAD_FOLDER'], comp_filename)
-                comp_file.save(comp_filepath)
-                comparison_filepaths.append(comp_filepath)
-        
-        if not comparison_filepaths:
-            flash('No valid comparison files uploaded', 'error')
-            return redirect(request.url)
-        
         # Get match columns (optional)
         match_columns_input = request.form.get('match_columns', '').strip()
         match_columns = None
         if match_columns_input:
             match_columns = [col.strip() for col in match_columns_input.split(',')]
         
-        # Initialize comparator and perform comparison
-        comparator = ExcelComparator(base_filepath)
-        
-        if not comparator.load_base_file():
-            flash('Error loading base file', 'error')
-            return redirect(request.url)
-        
-        # Perform comparison
-        comparator.compare_files(comparison_filepaths, match_columns)
-        
-        if not comparator.comparison_results:
-            flash('No comparison results generated', 'error')
+        profile_requested = app.config['PROFILING_ENABLED'] and request.values.get('profile') in ('1', 'on', 'true')
+        trace_filename = None
+        
+        # Each request saves its uploads into its own job folder
+        result_cache.evict()
+        prune_directory(PROFILE_FOLDER, max_age=RESULT_CACHE_TTL)
+        job_folder = result_cache.new_job_folder()
+        try:
+            # Save base file
+            base_filename = secure_filename(base_file.filename)
+            base_filepath = os.path.join(job_folder, base_filename)
+            base_file.save(base_filepath)
+            
+            # Get comparison files
+            comparison_files = request.files.getlist('comparison_files')
+            comparison_filepaths = []
+            
+            for comp_file in comparison_files:
+                if comp_file.filename != '' and allowed_file(comp_file.filename):
+                    comp_filename = secure_filename(comp_file.filename)
+                    comp_filepath = os.path.join(job_folder, comp_filename)
+                    comp_file.save(comp_filepath)
+                    comparison_filepaths.append(comp_filepath)
+            
+            if not comparison_filepaths:
+                flash('No valid comparison files uploaded', 'error')
+                return redirect(request.url)
+            
+            errors = []
+            
+            def run_comparison(output_filepath, profiler=None):
+                # Reserve memory for the job, streaming large jobs if opted in
+                estimate = estimate_job_memory([base_filepath] + comparison_filepaths)
+                engine, job_bytes = admission.plan(estimate)
+                
+                with admission.admit(job_bytes):
+                    # Initialize comparator and perform comparison
+                    comparator = ExcelComparator(base_filepath, ingest_cache=ingest_cache)
+                    comparator.profiler = profiler
+                    
+                    # The merge engine streams the base file instead of loading it
+                    if engine == 'hash' and not comparator.load_base_file():
+                        errors.append('Error loading base file')
+                        return False
+                    
+                    comparator.compare_files(comparison_filepaths, match_columns, engine=engine)
+                    
+                    if not comparator.comparison_results:
+                        errors.append('No comparison results generated')
+                        return False
+                    
+                    with comparator.span('export'):
+                        comparator.export_results(output_filepath)
+                    return True
+            
+            if profile_requested:
+                # Profiled runs skip the result cache so the trace shows real work
+                profile_id = uuid.uuid4().hex
+                output_filepath = os.path.join(PROFILE_FOLDER, f'{profile_id}.xlsx')
+                trace_filename = f'{profile_id}.json'
+                profiler = RunProfiler()
+                profiler.start()
+                try:
+                    with profiler.span('upload', files=len(comparison_filepaths)):
+                        output_file = open(output_filepath, 'rb') if run_comparison(output_filepath, profiler) else None
+                finally:
+                    profiler.stop()
+                    profiler.write_trace(os.path.join(PROFILE_FOLDER, trace_filename))
+            else:
+                # Identical requests share one computation and its stored output;
+                # the result comes back open so eviction cannot remove it before sending
+                cache_key = result_cache.make_key(base_filepath, comparison_filepaths, match_columns)
+                output_file, _ = result_cache.get_or_compute(cache_key, run_comparison)
+        finally:
+            # Clean up uploaded files
+            shutil.rmtree(job_folder, ignore_errors=True)
+        
+        if output_file is None:
+            flash(errors[0] if errors else 'No comparison results generated', 'error')
             return redirect(request.url)
         
-        # Generate output filename
-        output_filename = f"comparison_results_{len(comparison_filepaths)}_files.xlsx"
-        output_filepath = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-        
-        # Export results
-        comparator.export_results(output_filepath)
-        
-        # Clean up uploaded files
-        for filepath in [base_filepath] + comparison_filepaths:
-            try:
-                os.remove(filepath)
-            except:
-                pass
-        
         # Return the results file
-        return send_file(
-            output_filepath,
+        output_filename = f"comparison_results_{len(comparison_filepaths)}_files.xlsx"
+        response = send_file(
+            output_file,
             as_attachment=True,
             download_name=output_filename,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
-        
+        if trace_filename:
+            trace_url = url_for('download_profile', filename=trace_filename)
+            response.headers['X-Profile-Trace'] = trace_url
+            flash(f'Profile trace saved: {trace_url}', 'success')
+        return response
+        
+    except AdmissionRejected as e:
+        flash(f'Server is busy: {str(e)}', 'error')
+        return redirect(url_for('index'))
     except Exception as e:
         flash(f'Error processing files: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+@app.route('/profiles/<filename>')
+def download_profile(filename):
+    filepath = os.path.join(PROFILE_FOLDER, secure_filename(filename))
+    if filename.endswith('.json') and os.path.exists(filepath):
+        return send_file(filepath, as_attachment=True, mimetype='application/json')
+    else:
+        flash('Profile not found', 'error')
+        return redirect(url_for('index'))
+
+@app.route('/status')
+def status():
+    return jsonify(admission.status())
+
 @app.route('/download/<filename>')
 def download_file(filename):
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
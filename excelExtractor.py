@@ -7,23 +7,59 @@ from datetime import datetime
 import openpyxl
 from openpyxl.styles import PatternFill, Font
 from openpyxl.utils.dataframe import dataframe_to_rows
+from parallel_export import write_workbook, write_workbooks
+from sorted_merge import (
+    SpilledRows, UnsortedInputError, convert_row, external_sort, infer_column_kinds,
+    key_function, keyed_rows, merge_join, read_header, read_rows, sample_file
+)
+from itertools import combinations
+from contextlib import nullcontext
+from ingest_cache import IngestCache
+from profiling import RunProfiler
+
+# Key discovery settings
+KEY_SAMPLE_SIZE = 1000
+MAX_KEY_COLUMNS = 3
+MAX_KEY_CANDIDATES = 6
+MAX_KEY_NULL_RATE = 0.05
+# Share of sampled comparison keys that must also occur in the base file
+MIN_KEY_OVERLAP = 0.5
+
+# Values clean_data produces for empty text cells
+NULL_TOKENS = {'', 'NAN', 'NONE', 'NAT'}
 
 class ExcelComparator:
-    def __init__(self, base_file_path):
+    def __init__(self, base_file_path, ingest_cache=None):
         """
         Initialize the Excel Comparator with a base employee file
         
         Args:
             base_file_path (str): Path to the base Excel file containing employee data
+            ingest_cache (IngestCache): Columnar cache for parsed workbooks (optional)
         """
         self.base_file_path = base_file_path
         self.base_data = None
         self.comparison_results = {}
+        self.ingest_cache = ingest_cache
+        self.profiler = None
+    
+    def span(self, name, **args):
+        """Time a stage when a RunProfiler is attached"""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.span(name, **args)
+    
+    def read_excel(self, file_path):
+        """Read a workbook, through the ingest cache when one is configured"""
+        if self.ingest_cache is not None:
+            return self.ingest_cache.read_excel(file_path)
+        return pd.read_excel(file_path)
         
     def load_base_file(self):
         """Load the base Excel file"""
         try:
-            self.base_data = pd.read_excel(self.base_file_path)
+            with self.span('load base file', file=Path(self.base_file_path).name):
+                self.base_data = self.read_excel(self.base_file_path)
             print(f"✓ Base file loaded successfully: {len(self.base_data)} records")
             print(f"✓ Columns in base file: {list(self.base_data.columns)}")
             return True
@@ -49,53 +85,218 @@ class ExcelComparator:
         common_cols = list(cols1.intersection(cols2))
         return common_cols
     
-    def compare_files(self, comparison_files, match_columns=None):
+    def profile_columns(self, df, columns, reference_df=None):
+        """
+        Profile columns of a (sampled) dataframe for key discovery
+        
+        Args:
+            df (DataFrame): Rows to profile
+            columns (list): Columns to profile
+            reference_df (DataFrame): If given, also record what fraction of
+                each column's values occur in the same column of this frame
+        
+        Returns:
+            dict: Column name -> cardinality, null_rate, uniqueness, avg_width
+                (and overlap when reference_df is given)
+        """
+        profiles = {}
+        for col in columns:
+            values = df[col]
+            nulls = values.isna() | values.isin(NULL_TOKENS)
+            non_null = values[~nulls]
+            cardinality = int(non_null.nunique())
+            profile = {
+                'cardinality': cardinality,
+                'null_rate': round(float(nulls.mean()), 4) if len(values) else 0.0,
+                'uniqueness': round(cardinality / len(non_null), 4) if len(non_null) else 0.0,
+                'avg_width': round(float(non_null.astype(str).str.len().mean()), 2) if len(non_null) else 0.0,
+            }
+            if reference_df is not None:
+                overlap = non_null.isin(set(reference_df[col].dropna())).mean() if len(non_null) else 0.0
+                profile['overlap'] = round(float(overlap), 4)
+            profiles[col] = profile
+        return profiles
+    
+    def key_overlap(self, comp_df, base_df, key_cols, base_rows=None):
+        """
+        Fraction of comp_df rows whose key_cols values occur together in base_df
+        
+        When base_df is a uniform sample of ``base_rows`` base rows, a unique
+        key is only found with probability len(base_df) / base_rows, so the
+        observed fraction is scaled up by that factor (capped at 1).
+        """
+        if len(comp_df) == 0 or len(base_df) == 0:
+            return 0.0
+        comp_keys = pd.MultiIndex.from_frame(comp_df[key_cols])
+        base_keys = pd.MultiIndex.from_frame(base_df[key_cols])
+        overlap = float(comp_keys.isin(base_keys).mean())
+        if base_rows and base_rows > len(base_df):
+            overlap = min(1.0, overlap * base_rows / len(base_df))
+        return round(overlap, 4)
+    
+    def discover_key(self, base_df, comp_df, common_cols, sample_size=KEY_SAMPLE_SIZE, base_rows=None):
+        """
+        Pick a minimal unique key from the common columns
+        
+        Columns are profiled on a row sample of each file. Columns with few
+        nulls are ranked by uniqueness in the base sample, then by how many
+        comparison values also appear in the base rows, then by narrowness.
+        Combinations of up to MAX_KEY_COLUMNS top-ranked columns are tried
+        smallest first; within a size, combinations unique in the base sample
+        are ordered by key overlap (the share of sampled comparison rows whose
+        key occurs in ``base_df``) and the first one that reaches
+        MIN_KEY_OVERLAP and has no duplicates in ``base_df`` is used. A key
+        that is unique but matches nothing, such as a salary column, never
+        beats a composite key that does match.
+        
+        Uniqueness is only as good as the rows passed in: the hash engine
+        passes the whole cleaned base file, the merge engine a uniform sample
+        of KEY_SAMPLE_SIZE rows together with ``base_rows``, and its overlaps
+        are scaled by the sampling fraction. If no key reaches the overlap
+        threshold, the unique key with the highest non-zero overlap is used;
+        if there is none, all common columns are used as before.
+        
+        Args:
+            base_df (DataFrame): Cleaned base data, or a uniform sample of it
+            comp_df (DataFrame): Cleaned comparison data
+            common_cols (list): Columns present in both files
+            sample_size (int): Rows sampled from each file for profiling
+            base_rows (int): Rows in the whole base file when base_df is a
+                sample (optional)
+        
+        Returns:
+            tuple: (list of key columns, dict of key discovery stats)
+        """
+        # Keep base column order so ties resolve the same way on every run
+        common_cols = [col for col in base_df.columns if col in common_cols]
+        
+        def sample(df):
+            if len(df) > sample_size:
+                return df.sample(n=sample_size, random_state=0)
+            return df
+        
+        base_sample = sample(base_df)
+        comp_sample = sample(comp_df)
+        base_profile = self.profile_columns(base_sample, common_cols)
+        comp_profile = self.profile_columns(comp_sample, common_cols, reference_df=base_df)
+        
+        candidates = [
+            col for col in common_cols
+            if base_profile[col]['null_rate'] <= MAX_KEY_NULL_RATE
+            and comp_profile[col]['null_rate'] <= MAX_KEY_NULL_RATE
+            and base_profile[col]['cardinality'] > 0
+        ]
+        candidates.sort(key=lambda col: (
+            -base_profile[col]['uniqueness'],
+            -comp_profile[col]['overlap'],
+            base_profile[col]['avg_width'],
+        ))
+        candidates = candidates[:MAX_KEY_CANDIDATES]
+        
+        stats = {
+            'method': 'fallback',
+            'sample_rows': {'base': len(base_sample), 'comparison': len(comp_sample)},
+            'checked_base_rows': len(base_df),
+            'overlap': None,
+            'base_profile': base_profile,
+            'comparison_profile': comp_profile,
+        }
+        
+        low_overlap = []
+        for size in range(1, MAX_KEY_COLUMNS + 1):
+            scored = []
+            for combo in combinations(candidates, size):
+                key_cols = list(combo)
+                # Cheap check on the sample before the full-file check
+                if base_sample.duplicated(subset=key_cols).any():
+                    continue
+                scored.append((self.key_overlap(comp_sample, base_df, key_cols, base_rows), key_cols))
+            
+            # Stable sort keeps the candidate ranking among equal overlaps
+            scored.sort(key=lambda item: -item[0])
+            for overlap, key_cols in scored:
+                if overlap < MIN_KEY_OVERLAP:
+                    if overlap > 0:
+                        low_overlap.append((overlap, key_cols))
+                    continue
+                if base_df.duplicated(subset=key_cols).any():
+                    continue
+                stats['method'] = 'discovered'
+                stats['overlap'] = overlap
+                return key_cols, stats
+        
+        # Nothing matched well enough; settle for the best partial match
+        low_overlap.sort(key=lambda item: -item[0])
+        for overlap, key_cols in low_overlap:
+            if not base_df.duplicated(subset=key_cols).any():
+                stats['method'] = 'low_overlap'
+                stats['overlap'] = overlap
+                return key_cols, stats
+        
+        return common_cols, stats
+    
+    def compare_files(self, comparison_files, match_columns=None, engine='hash', chunk_rows=100000):
         """
         Compare multiple files against the base file
         
         Args:
             comparison_files (list): List of file paths to compare
             match_columns (list): Specific columns to use for matching (optional)
+            engine (str): 'hash' loads both files and uses key sets, 'merge'
+                streams key-sorted files without loading them (optional)
+            chunk_rows (int): Rows per spill file when the merge engine has
+                to sort unsorted input (optional)
         """
+        if engine == 'merge':
+            return self.compare_files_sorted(comparison_files, match_columns, chunk_rows)
+        
         if self.base_data is None:
             print("✗ Please load the base file first")
             return
         
-        base_clean = self.clean_data(self.base_data)
+        with self.span('clean base file'):
+            base_clean = self.clean_data(self.base_data)
         
         for file_path in comparison_files:
             try:
                 print(f"\n🔍 Processing: {file_path}")
                 
-                # Load comparison file
-                comp_data = pd.read_excel(file_path)
-                comp_clean = self.clean_data(comp_data)
-                
-                print(f"✓ Loaded {len(comp_data)} records from {Path(file_path).name}")
-                
-                # Find common columns
-                common_cols = self.find_common_columns(base_clean, comp_clean)
-                if not common_cols:
-                    print(f"✗ No common columns found with base file")
-                    continue
-                
-                # Use specified match columns or all common columns
-                if match_columns:
-                    match_cols = [col for col in match_columns if col in common_cols]
-                    if not match_cols:
-                        print(f"✗ None of the specified match columns found")
+                with self.span(f'compare {Path(file_path).name}', file=file_path):
+                    # Load comparison file
+                    with self.span('read'):
+                        comp_data = self.read_excel(file_path)
+                    with self.span('clean'):
+                        comp_clean = self.clean_data(comp_data)
+                    
+                    print(f"✓ Loaded {len(comp_data)} records from {Path(file_path).name}")
+                    
+                    # Find common columns
+                    common_cols = self.find_common_columns(base_clean, comp_clean)
+                    if not common_cols:
+                        print(f"✗ No common columns found with base file")
                         continue
-                else:
-                    match_cols = common_cols
-                
-                print(f"✓ Using columns for matching: {match_cols}")
-                
-                # Perform comparison
-                result = self.perform_comparison(
-                    base_clean, comp_clean, match_cols, Path(file_path).name
-                )
-                
-                self.comparison_results[Path(file_path).name] = result
+                    
+                    # Use specified match columns or all common columns
+                    if match_columns:
+                        match_cols = [col for col in match_columns if col in common_cols]
+                        if not match_cols:
+                            print(f"✗ None of the specified match columns found")
+                            continue
+                        key_stats = None
+                    else:
+                        with self.span('discover key'):
+                            match_cols, key_stats = self.discover_key(base_clean, comp_clean, common_cols)
+                        self.print_key_discovery(match_cols, key_stats)
+                    
+                    print(f"✓ Using columns for matching: {match_cols}")
+                    
+                    # Perform comparison
+                    result = self.perform_comparison(
+                        base_clean, comp_clean, match_cols, Path(file_path).name
+                    )
+                    result['key_discovery'] = key_stats
+                    
+                    self.comparison_results[Path(file_path).name] = result
                 
             except Exception as e:
                 print(f"✗ Error processing {file_path}: {e}")
@@ -104,30 +305,25 @@ class ExcelComparator:
         """Perform detailed comparison between base and comparison dataframes"""
         
         # Create a composite key for matching
-        if len(match_cols) == 1:
-            base_df['_match_key'] = base_df[match_cols[0]]
-            comp_df['_match_key'] = comp_df[match_cols[0]]
-        else:
-            base_df['_match_key'] = base_df[match_cols].apply(
-                lambda x: '|'.join(x.astype(str)), axis=1
-            )
-            comp_df['_match_key'] = comp_df[match_cols].apply(
-                lambda x: '|'.join(x.astype(str)), axis=1
-            )
+        with self.span('build match keys', columns=len(match_cols)):
+            base_df['_match_key'] = self.build_match_key(base_df, match_cols)
+            comp_df['_match_key'] = self.build_match_key(comp_df, match_cols)
         
         # Find matches and misses
-        base_keys = set(base_df['_match_key'].dropna())
-        comp_keys = set(comp_df['_match_key'].dropna())
-        
-        matched_keys = base_keys.intersection(comp_keys)
-        missing_in_comp = base_keys - comp_keys
-        extra_in_comp = comp_keys - base_keys
+        with self.span('set operations'):
+            base_keys = set(base_df['_match_key'].dropna())
+            comp_keys = set(comp_df['_match_key'].dropna())
+            
+            matched_keys = base_keys.intersection(comp_keys)
+            missing_in_comp = base_keys - comp_keys
+            extra_in_comp = comp_keys - base_keys
         
         # Create result dataframes
-        matched_base = base_df[base_df['_match_key'].isin(matched_keys)].copy()
-        matched_comp = comp_df[comp_df['_match_key'].isin(matched_keys)].copy()
-        missing_records = base_df[base_df['_match_key'].isin(missing_in_comp)].copy()
-        extra_records = comp_df[comp_df['_match_key'].isin(extra_in_comp)].copy()
+        with self.span('slice results'):
+            matched_base = base_df[base_df['_match_key'].isin(matched_keys)].copy()
+            matched_comp = comp_df[comp_df['_match_key'].isin(matched_keys)].copy()
+            missing_records = base_df[base_df['_match_key'].isin(missing_in_comp)].copy()
+            extra_records = comp_df[comp_df['_match_key'].isin(extra_in_comp)].copy()
         
         # Remove the temporary match key
         for df in [matched_base, matched_comp, missing_records, extra_records]:
@@ -148,68 +344,351 @@ class ExcelComparator:
             'extra_records': extra_records
         }
         
-        # Print summary
-        print(f"📊 Comparison Summary for {file_name}:")
+        self.print_comparison_summary(result)
+        
+        return result
+    
+    def build_match_key(self, df, match_cols):
+        """
+        Build the match key for a cleaned dataframe
+        
+        Frames read through the ingest cache carry their content hash, so the
+        key is built once per workbook and set of match columns.
+        """
+        content_hash = df.attrs.get('content_hash')
+        if self.ingest_cache is None or not content_hash:
+            return self.compute_match_key(df, match_cols)
+        
+        key = self.ingest_cache.match_key(
+            content_hash, match_cols, lambda: self.compute_match_key(df, match_cols)
+        )
+        return key.set_axis(df.index)
+    
+    def compute_match_key(self, df, match_cols):
+        """Compute the match key from one column or a '|'-joined composite"""
+        if len(match_cols) == 1:
+            return df[match_cols[0]]
+        return df[match_cols].apply(
+            lambda x: '|'.join(x.astype(str)), axis=1
+        )
+    
+    def print_key_discovery(self, match_cols, key_stats):
+        """Print the outcome of key discovery"""
+        if key_stats['method'] == 'fallback':
+            print("⚠ No unique key found in sample, using all common columns")
+            return
+        profile = key_stats['base_profile']
+        details = ', '.join(
+            f"{col} (uniqueness {profile[col]['uniqueness']:.0%}, nulls {profile[col]['null_rate']:.0%})"
+            for col in match_cols
+        )
+        print(f"✓ Discovered key from {key_stats['sample_rows']['base']} sampled rows: {details}")
+        print(f"   • Overlap with base: {key_stats['overlap']:.0%} of sampled comparison rows, "
+              f"unique in {key_stats['checked_base_rows']} base rows checked")
+        if key_stats['method'] == 'low_overlap':
+            print(f"⚠ No key reached {MIN_KEY_OVERLAP:.0%} overlap, using the best partial match")
+    
+    def print_comparison_summary(self, result):
+        """Print the counts for a single comparison result"""
+        print(f"📊 Comparison Summary for {result['file_name']}:")
         print(f"   • Total records in base: {result['total_base_records']}")
         print(f"   • Total records in comparison: {result['total_comp_records']}")
         print(f"   • Matched records: {result['matched_records']}")
         print(f"   • Missing in comparison: {result['missing_in_comparison']}")
         print(f"   • Extra in comparison: {result['extra_in_comparison']}")
+    
+    def compare_files_sorted(self, comparison_files, match_columns=None, chunk_rows=100000):
+        """
+        Compare files against the base file with a sorted merge-join
+        
+        Both files are streamed row by row instead of loaded into DataFrames.
+        A first pass infers each column's dtype so rows are cleaned and keyed
+        the same way as by the hash engine, and draws the uniform row samples
+        used for key discovery. Inputs already sorted by the match
+        columns are then compared in a single pass; if a file turns out not
+        to be sorted, it is re-read through an external sort that spills to
+        disk every ``chunk_rows`` rows.
+        
+        Args:
+            comparison_files (list): List of file paths to compare
+            match_columns (list): Specific columns to use for matching (optional)
+            chunk_rows (int): Rows per spill file for the external sort
+        """
+        base_header = read_header(self.base_file_path)
+        if not base_header:
+            print("✗ Base file has no header row")
+            return
+        
+        sort_base = False
+        
+        # A streaming pass works out the dtypes read_excel would give each column,
+        # so rows are cleaned and keyed exactly like the hash engine, and samples
+        # rows across the whole file for key discovery
+        base_kinds, base_sample, base_total = sample_file(self.base_file_path, KEY_SAMPLE_SIZE)
+        
+        for file_path in comparison_files:
+            try:
+                print(f"\n🔍 Processing (sorted merge): {file_path}")
+                
+                comp_kinds, comp_sample, _ = sample_file(file_path, KEY_SAMPLE_SIZE)
+                comp_header = list(comp_sample.columns)
+                common_cols = [col for col in base_header if col in comp_header]
+                if not common_cols:
+                    print(f"✗ No common columns found with base file")
+                    continue
+                
+                if match_columns:
+                    match_cols = [col for col in match_columns if col in common_cols]
+                    if not match_cols:
+                        print(f"✗ None of the specified match columns found")
+                        continue
+                    key_stats = None
+                else:
+                    # Profile the sampled rows; the files are never fully loaded.
+                    # Uniqueness over the whole base file is checked during the merge.
+                    match_cols, key_stats = self.discover_key(
+                        base_sample, comp_sample, common_cols, base_rows=base_total
+                    )
+                    self.print_key_discovery(match_cols, key_stats)
+                
+                print(f"✓ Using columns for matching: {match_cols}")
+                
+                sort_comp = False
+                while True:
+                    try:
+                        with self.span(f'merge compare {Path(file_path).name}', file=file_path,
+                                       sort_base=sort_base, sort_comp=sort_comp):
+                            result = self.perform_merge_comparison(
+                                file_path, match_cols, sort_base, sort_comp, chunk_rows,
+                                base_kinds, comp_kinds
+                            )
+                        break
+                    except UnsortedInputError as e:
+                        print(f"⚠ {e}, falling back to external sort")
+                        if e.side == 'base':
+                            sort_base = True
+                        else:
+                            sort_comp = True
+                
+                if key_stats is not None:
+                    key_stats['checked_base_rows'] = result['total_base_records']
+                    key_stats['duplicate_base_keys'] = result['duplicate_base_keys']
+                    if result['duplicate_base_keys'] and key_stats['method'] != 'fallback':
+                        print(f"⚠ Discovered key is not unique in the full base file "
+                              f"({result['duplicate_base_keys']} duplicated keys)")
+                result['key_discovery'] = key_stats
+                self.comparison_results[Path(file_path).name] = result
+                
+            except Exception as e:
+                print(f"✗ Error processing {file_path}: {e}")
+    
+    def perform_merge_comparison(self, file_path, match_cols, sort_base=False, sort_comp=False,
+                                 chunk_rows=100000, base_kinds=None, comp_kinds=None):
+        """
+        Stream the base and one comparison file through merge_join
+        
+        The result rows are returned as SpilledRows backed by temporary files
+        rather than DataFrames, so memory does not grow with the file size.
+        
+        Args:
+            file_path (str): Comparison file
+            match_cols (list): Columns to match on
+            sort_base (bool): Externally sort the base file first
+            sort_comp (bool): Externally sort the comparison file first
+            chunk_rows (int): Rows per spill file for the external sort
+            base_kinds (list): Column kinds from infer_column_kinds (optional)
+            comp_kinds (list): Column kinds from infer_column_kinds (optional)
+        """
+        if base_kinds is None:
+            base_kinds = infer_column_kinds(self.base_file_path)
+        if comp_kinds is None:
+            comp_kinds = infer_column_kinds(file_path)
+        
+        base_header, base_rows = read_rows(self.base_file_path)
+        comp_header, comp_rows = read_rows(file_path)
+        
+        counts = {'base': 0, 'comp': 0}
+        
+        def converted(rows, side, kinds):
+            for row in rows:
+                counts[side] += 1
+                yield convert_row(row, kinds)
+        
+        base_keyed = keyed_rows(converted(base_rows, 'base', base_kinds),
+                                key_function(base_header, match_cols, base_kinds))
+        comp_keyed = keyed_rows(converted(comp_rows, 'comp', comp_kinds),
+                                key_function(comp_header, match_cols, comp_kinds))
+        if sort_base:
+            base_keyed = external_sort(base_keyed, chunk_rows)
+        if sort_comp:
+            comp_keyed = external_sort(comp_keyed, chunk_rows)
+        
+        # Each key group goes straight to a spill file; only counts stay in memory
+        key_counts = {'matched': 0, 'missing': 0, 'extra': 0}
+        duplicate_base_keys = 0
+        matched_base = SpilledRows(base_header)
+        matched_comp = SpilledRows(comp_header)
+        missing_records = SpilledRows(base_header)
+        extra_records = SpilledRows(comp_header)
+        spilled = [matched_base, matched_comp, missing_records, extra_records]
+        
+        try:
+            for status, base_group, comp_group in merge_join(base_keyed, comp_keyed):
+                key_counts[status] += 1
+                if len(base_group) > 1:
+                    duplicate_base_keys += 1
+                if status == 'matched':
+                    matched_base.extend(base_group)
+                    matched_comp.extend(comp_group)
+                elif status == 'missing':
+                    missing_records.extend(base_group)
+                else:
+                    extra_records.extend(comp_group)
+        except BaseException:
+            # A retry with external sort starts over, so drop the partial output
+            for rows in spilled:
+                rows.cleanup()
+            raise
+        
+        for rows in spilled:
+            rows.close()
+        
+        result = {
+            'file_name': Path(file_path).name,
+            'match_columns': match_cols,
+            'total_base_records': counts['base'],
+            'total_comp_records': counts['comp'],
+            'matched_records': key_counts['matched'],
+            'missing_in_comparison': key_counts['missing'],
+            'extra_in_comparison': key_counts['extra'],
+            'duplicate_base_keys': duplicate_base_keys,
+            'matched_data_base': matched_base,
+            'matched_data_comp': matched_comp,
+            'missing_records': missing_records,
+            'extra_records': extra_records
+        }
+        
+        self.print_comparison_summary(result)
         
         return result
     
-    def export_results(self, output_path="comparison_results.xlsx"):
-        """Export comparison results to Excel with multiple sheets"""
+    def build_summary(self, results=None):
+        """Build the Summary sheet rows for the given (or all) comparison results"""
+        if results is None:
+            results = self.comparison_results
+        
+        summary_data = []
+        for file_name, result in results.items():
+            summary_data.append({
+                'File Name': result['file_name'],
+                'Match Columns': ', '.join(result['match_columns']),
+                'Base Records': result['total_base_records'],
+                'Comparison Records': result['total_comp_records'],
+                'Matched': result['matched_records'],
+                'Missing in Comparison': result['missing_in_comparison'],
+                'Extra in Comparison': result['extra_in_comparison'],
+                'Match Rate %': round((result['matched_records'] / result['total_base_records']) * 100, 2) if result['total_base_records'] > 0 else 0
+            })
+        
+        return pd.DataFrame(summary_data)
+    
+    def result_sheets(self, file_name, result):
+        """List the (sheet name, DataFrame or SpilledRows) pairs exported for one comparison"""
+        safe_name = file_name.replace('.xlsx', '').replace('.xls', '')[:31]  # Excel sheet name limit
+        
+        sheets = []
+        
+        # Matched records sheet
+        if not result['matched_data_base'].empty:
+            sheets.append((f'{safe_name}_Matched', result['matched_data_base']))
+        
+        # Missing records sheet
+        if not result['missing_records'].empty:
+            sheets.append((f'{safe_name}_Missing', result['missing_records']))
+        
+        # Extra records sheet
+        if not result['extra_records'].empty:
+            sheets.append((f'{safe_name}_Extra', result['extra_records']))
+        
+        return sheets
+    
+    def export_results(self, output_path="comparison_results.xlsx", parallel=False, max_workers=None):
+        """
+        Export comparison results to Excel with multiple sheets
+        
+        Args:
+            output_path (str): Path of the workbook to create
+            parallel (bool): Serialize sheets concurrently in worker processes
+                and assemble the workbook directly instead of using ExcelWriter
+            max_workers (int): Worker processes for parallel export (optional)
+        
+        Results from the merge engine are spilled to disk; they are always
+        streamed into the workbook instead of being loaded into openpyxl.
+        """
         
         if not self.comparison_results:
             print("✗ No comparison results to export")
             return
         
+        summary_df = self.build_summary()
+        
+        sheets = [('Summary', summary_df, True)]
+        for file_name, result in self.comparison_results.items():
+            sheets.extend((name, df, False) for name, df in self.result_sheets(file_name, result))
+        streamed = any(not isinstance(df, pd.DataFrame) for _, df, _ in sheets)
+        
+        if parallel or streamed:
+            write_workbook(output_path, sheets, max_workers if parallel else 0)
+            print(f"✓ Results exported to: {output_path}")
+            return
+        
         with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
             
             # Create summary sheet
-            summary_data = []
-            for file_name, result in self.comparison_results.items():
-                summary_data.append({
-                    'File Name': result['file_name'],
-                    'Match Columns': ', '.join(result['match_columns']),
-                    'Base Records': result['total_base_records'],
-                    'Comparison Records': result['total_comp_records'],
-                    'Matched': result['matched_records'],
-                    'Missing in Comparison': result['missing_in_comparison'],
-                    'Extra in Comparison': result['extra_in_comparison'],
-                    'Match Rate %': round((result['matched_records'] / result['total_base_records']) * 100, 2) if result['total_base_records'] > 0 else 0
-                })
-            
-            summary_df = pd.DataFrame(summary_data)
             summary_df.to_excel(writer, sheet_name='Summary', index=False)
             
             # Create detailed sheets for each comparison
-            for file_name, result in self.comparison_results.items():
-                safe_name = file_name.replace('.xlsx', '').replace('.xls', '')[:31]  # Excel sheet name limit
-                
-                # Matched records sheet
-                if not result['matched_data_base'].empty:
-                    result['matched_data_base'].to_excel(
-                        writer, sheet_name=f'{safe_name}_Matched', index=False
-                    )
-                
-                # Missing records sheet
-                if not result['missing_records'].empty:
-                    result['missing_records'].to_excel(
-                        writer, sheet_name=f'{safe_name}_Missing', index=False
-                    )
-                
-                # Extra records sheet
-                if not result['extra_records'].empty:
-                    result['extra_records'].to_excel(
-                        writer, sheet_name=f'{safe_name}_Extra', index=False
-                    )
+            for sheet_name, df, _ in sheets[1:]:
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
         
         # Apply formatting
-        self.format_excel_output(output_path)
+        with self.span('format output'):
+            self.format_excel_output(output_path)
         print(f"✓ Results exported to: {output_path}")
     
+    def export_results_per_file(self, output_dir, max_workers=None):
+        """
+        Export one workbook per comparison file, written in parallel
+        
+        Each workbook holds a Summary sheet with that file's row followed by
+        its Matched/Missing/Extra sheets.
+        
+        Args:
+            output_dir (str): Folder for the workbooks
+            max_workers (int): Worker processes (optional)
+        
+        Returns:
+            list: Paths of the written workbooks
+        """
+        if not self.comparison_results:
+            print("✗ No comparison results to export")
+            return []
+        
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        
+        workbooks = []
+        for file_name, result in self.comparison_results.items():
+            safe_name = file_name.replace('.xlsx', '').replace('.xls', '')
+            output_path = str(Path(output_dir) / f'{safe_name}_comparison.xlsx')
+            sheets = [('Summary', self.build_summary({file_name: result}), True)]
+            sheets.extend((name, df, False) for name, df in self.result_sheets(file_name, result))
+            workbooks.append((output_path, sheets))
+        
+        paths = write_workbooks(workbooks, max_workers)
+        for path in paths:
+            print(f"✓ Results exported to: {path}")
+        return paths
+    
     def format_excel_output(self, file_path):
         """Apply formatting to the Excel output"""
         try:
@@ -273,6 +752,21 @@ def main():
     parser.add_argument('comparison_files', nargs='+', help='Paths to files to compare against base')
     parser.add_argument('--match-columns', nargs='+', help='Specific columns to use for matching')
     parser.add_argument('--output', default='comparison_results.xlsx', help='Output file path')
+    parser.add_argument('--engine', choices=['hash', 'merge'], default='hash',
+                        help="Comparison engine: 'hash' loads files into memory, "
+                             "'merge' streams files sorted by the match columns")
+    parser.add_argument('--chunk-rows', type=int, default=100000,
+                        help='Rows per spill file when the merge engine sorts unsorted input')
+    parser.add_argument('--parallel-export', action='store_true',
+                        help='Serialize result sheets in parallel worker processes')
+    parser.add_argument('--split-output', metavar='DIR',
+                        help='Write one result workbook per comparison file into DIR')
+    parser.add_argument('--workers', type=int, help='Worker processes for parallel export')
+    parser.add_argument('--ingest-cache', metavar='DIR',
+                        help='Cache parsed workbooks as Feather files in DIR for faster re-runs')
+    parser.add_argument('--profile', metavar='TRACE_FILE',
+                        help='Write a Chrome trace (stage spans, sampled stacks, allocations) '
+                             'viewable in Perfetto or speedscope')
     
     args = parser.parse_args()
     
@@ -280,22 +774,42 @@ def main():
     print("="*50)
     
     # Initialize comparator
-    comparator = ExcelComparator(args.base_file)
+    ingest_cache = IngestCache(args.ingest_cache) if args.ingest_cache else None
+    comparator = ExcelComparator(args.base_file, ingest_cache=ingest_cache)
     
-    # Load base file
-    if not comparator.load_base_file():
-        sys.exit(1)
+    # Attach a profiler for the rest of the run
+    if args.profile:
+        comparator.profiler = RunProfiler()
+        comparator.profiler.start()
     
-    # Perform comparisons
-    comparator.compare_files(args.comparison_files, args.match_columns)
-    
-    # Export results
-    comparator.export_results(args.output)
+    try:
+        # Load base file (the merge engine streams it instead)
+        if args.engine == 'hash' and not comparator.load_base_file():
+            sys.exit(1)
+        
+        # Perform comparisons
+        comparator.compare_files(
+            args.comparison_files, args.match_columns, engine=args.engine, chunk_rows=args.chunk_rows
+        )
+        
+        # Export results
+        with comparator.span('export'):
+            if args.split_output:
+                comparator.export_results_per_file(args.split_output, args.workers)
+                output_location = args.split_output
+            else:
+                comparator.export_results(args.output, parallel=args.parallel_export, max_workers=args.workers)
+                output_location = args.output
+    finally:
+        if comparator.profiler is not None:
+            comparator.profiler.stop()
+            comparator.profiler.write_trace(args.profile)
+            print(f"✓ Profile trace written to: {args.profile}")
     
     # Print summary
     comparator.print_detailed_summary()
     
-    print(f"\n✅ Process completed! Check '{args.output}' for detailed results.")
+    print(f"\n✅ Process completed! Check '{output_location}' for detailed results.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+import uuid
+from datetime import date, datetime
+from datetime import time as dt_time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from result_cache import file_digest, prune_directory
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+DEFAULT_CACHE_DIR = os.path.join('uploads', 'ingest')
+
+# Bump when clean_data or the match key format changes so stale keys are ignored
+KEY_FORMAT_VERSION = 1
+
+# Schema metadata listing object columns stored as type-tagged text
+TAGGED_COLUMNS_KEY = b'excel_extractor.tagged_columns'
+
+
+def _encode_value(value):
+    """Store a cell of a mixed-type column as text prefixed with its type"""
+    if value is None or value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, str):
+        return 's:' + value
+    if isinstance(value, (bool, np.bool_)):
+        return 'b:1' if value else 'b:0'
+    if isinstance(value, (int, np.integer)):
+        return f'i:{int(value)}'
+    if isinstance(value, (float, np.floating)):
+        return f'f:{float(value)!r}'
+    if isinstance(value, pd.Timestamp):
+        return 'T:' + value.isoformat()
+    if isinstance(value, datetime):
+        return 'd:' + value.isoformat()
+    if isinstance(value, date):
+        return 'D:' + value.isoformat()
+    if isinstance(value, dt_time):
+        return 't:' + value.isoformat()
+    raise TypeError(f'cannot cache values of type {type(value).__name__}')
+
+
+def _decode_value(text):
+    """Inverse of _encode_value"""
+    if text is None:
+        return np.nan
+    tag, body = text[0], text[2:]
+    if tag == 's':
+        return body
+    if tag == 'b':
+        return body == '1'
+    if tag == 'i':
+        return int(body)
+    if tag == 'f':
+        return float(body)
+    if tag == 'T':
+        return pd.Timestamp(body)
+    if tag == 'd':
+        return datetime.fromisoformat(body)
+    if tag == 'D':
+        return date.fromisoformat(body)
+    return dt_time.fromisoformat(body)
+
+
+class IngestCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=1024 * 1024 * 1024,
+                 max_age=None, compression='zstd'):
+        """
+        Cache parsed workbooks as Feather files keyed by content hash
+
+        The first read of a workbook parses it with pandas and stores the
+        frame; later reads of identical content load the Feather file
+        instead. Text columns that also hold numbers or dates, which Arrow
+        cannot store as one type, are saved as type-tagged text and restored
+        on read; a workbook that still cannot be stored gets a ``.skip``
+        marker so it is not converted again on every read. Cleaned match keys
+        are stored next to the frame per set of match columns. Requires
+        pyarrow; without it every read falls through to pandas.read_excel.
+
+        Args:
+            cache_dir (str): Folder for cached files
+            max_bytes (int): Size budget for the cache folder
+            max_age (float): Seconds before an unused entry expires (optional)
+            compression (str): Feather compression ('zstd', 'lz4' or
+                'uncompressed'); only uncompressed files are memory-mapped, since
+                compressed ones are decompressed into memory anyway
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = compression
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return feather is not None
+
+    def frame_path(self, content_hash):
+        return os.path.join(self.cache_dir, f'{content_hash}.feather')
+
+    def skip_path(self, content_hash):
+        return os.path.join(self.cache_dir, f'{content_hash}.skip')
+
+    def key_path(self, content_hash, match_cols):
+        digest = hashlib.sha256(
+            '\x1f'.join([str(KEY_FORMAT_VERSION)] + [str(col) for col in match_cols]).encode('utf-8')
+        ).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'{content_hash}.key-{digest}.feather')
+
+    def read_excel(self, file_path):
+        """
+        Read a workbook, using the cached columnar copy when available
+
+        The returned frame carries its content hash in ``df.attrs['content_hash']``
+        so match keys built from it can be cached too.
+        """
+        if not self.enabled:
+            return pd.read_excel(file_path)
+
+        content_hash = file_digest(file_path)
+        cached_path = self.frame_path(content_hash)
+        skip_path = self.skip_path(content_hash)
+
+        df = None if os.path.exists(skip_path) else self._read(cached_path)
+        if df is None:
+            df = pd.read_excel(file_path)
+            if os.path.exists(skip_path):
+                pass
+            elif self._write(df, cached_path):
+                self.evict()
+            else:
+                # Remember the failure so the conversion is not retried on every read
+                Path(skip_path).touch()
+        else:
+            print(f"✓ Loaded {Path(file_path).name} from ingest cache")
+
+        df.attrs['content_hash'] = content_hash
+        return df
+
+    def match_key(self, content_hash, match_cols, build):
+        """
+        Return the cached match key for a frame, building it on a miss
+
+        Args:
+            content_hash (str): Content hash of the source workbook
+            match_cols (list): Columns the key is built from
+            build (callable): Returns the key as a Series when not cached
+        """
+        key_path = self.key_path(content_hash, match_cols)
+        cached = self._read(key_path)
+        if cached is not None:
+            return cached['_match_key']
+
+        key = build()
+        self._write(pd.DataFrame({'_match_key': key.reset_index(drop=True)}), key_path)
+        return key
+
+    def _read(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            table = feather.read_table(path, memory_map=self.compression == 'uncompressed')
+            df = table.to_pandas()
+        except (OSError, pa.ArrowException):
+            return None
+        metadata = table.schema.metadata or {}
+        for col in json.loads(metadata.get(TAGGED_COLUMNS_KEY, b'[]')):
+            df[col] = df[col].map(_decode_value)
+        # Arrow stores NaN in text columns as null, which comes back as None;
+        # restore NaN so clean_data still turns empty cells into 'NAN'
+        for col in df.columns[df.dtypes == object]:
+            missing = df[col].isna()
+            if missing.any():
+                df[col] = df[col].where(~missing, np.nan)
+        # Refresh mtime so size-based eviction treats it as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return df
+
+    def _to_table(self, df):
+        """Convert a frame to Arrow, tagging mixed-type object columns as text"""
+        # Arrow would turn other header values into strings that no longer match
+        if not all(isinstance(col, str) for col in df.columns):
+            raise ValueError('column names must be strings')
+        try:
+            return pa.Table.from_pandas(df)
+        except pa.ArrowException:
+            pass
+
+        encoded = df.copy()
+        tagged = []
+        for col in df.columns[df.dtypes == object]:
+            try:
+                pa.array(df[col], from_pandas=True)
+            except pa.ArrowException:
+                encoded[col] = df[col].map(_encode_value)
+                tagged.append(col)
+        table = pa.Table.from_pandas(encoded)
+        metadata = dict(table.schema.metadata or {})
+        metadata[TAGGED_COLUMNS_KEY] = json.dumps(tagged).encode('utf-8')
+        return table.replace_schema_metadata(metadata)
+
+    def _write(self, df, path):
+        """Write a frame atomically; frames Arrow cannot represent are skipped"""
+        tmp_path = os.path.join(self.cache_dir, f'.{uuid.uuid4().hex}.feather')
+        try:
+            feather.write_feather(self._to_table(df), tmp_path, compression=self.compression)
+            os.replace(tmp_path, path)
+            return True
+        except (pa.ArrowException, ValueError, TypeError) as e:
+            print(f"⚠ Warning: Could not cache {Path(path).name}: {e}")
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self):
+        """Drop expired entries and the oldest entries beyond the size budget"""
+        return prune_directory(self.cache_dir, self.max_age, self.max_bytes)
+
+    def info(self):
+        """Summarize cache contents"""
+        entries = [p for p in Path(self.cache_dir).iterdir() if p.is_file() and not p.name.startswith('.')]
+        keys = [p for p in entries if '.key-' in p.name]
+        skipped = [p for p in entries if p.suffix == '.skip']
+        return {
+            'cache_dir': self.cache_dir,
+            'enabled': self.enabled,
+            'workbooks': len(entries) - len(keys) - len(skipped),
+            'match_keys': len(keys),
+            'skipped': len(skipped),
+            'total_bytes': sum(p.stat().st_size for p in entries),
+            'max_bytes': self.max_bytes,
+            'oldest': min((p.stat().st_mtime for p in entries), default=None),
+        }
+
+    def purge(self):
+        """Remove every cached entry"""
+        return prune_directory(self.cache_dir, max_bytes=0)
+
+
+def main():
+    """Inspect or purge the ingest cache"""
+    parser = argparse.ArgumentParser(description='Inspect or purge the columnar ingest cache')
+    parser.add_argument('command', choices=['info', 'purge', 'evict'],
+                        help="'info' shows usage, 'purge' removes everything, "
+                             "'evict' trims the cache to --max-mb")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Cache folder')
+    parser.add_argument('--max-mb', type=int, default=1024, help='Size budget in MB')
+
+    args = parser.parse_args()
+
+    if not Path(args.cache_dir).is_dir():
+        print(f"✗ Cache folder not found: {args.cache_dir}")
+        sys.exit(1)
+
+    cache = IngestCache(args.cache_dir, max_bytes=args.max_mb * 1024 * 1024)
+
+    if args.command == 'info':
+        info = cache.info()
+        print(f"📁 {info['cache_dir']}")
+        print(f"Enabled: {'yes' if info['enabled'] else 'no (pyarrow not installed)'}")
+        print(f"Workbooks: {info['workbooks']}")
+        print(f"Match keys: {info['match_keys']}")
+        print(f"Not cacheable: {info['skipped']}")
+        print(f"Size: {info['total_bytes'] / (1024 * 1024):.1f} MB of {info['max_bytes'] / (1024 * 1024):.0f} MB")
+        if info['oldest'] is not None:
+            print(f"Oldest entry: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['oldest']))}")
+    else:
+        removed = cache.purge() if args.command == 'purge' else cache.evict()
+        print(f"✓ Removed {len(removed)} cached files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import math
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+# Cell style indexes into STYLES_XML cellXfs
+STYLE_DEFAULT = 0
+STYLE_HEADER = 1
+STYLE_SUMMARY_HEADER = 2
+STYLE_DATETIME = 3
+STYLE_DATE = 4
+STYLE_TIME = 5
+
+# Header styles match what pandas writes (bold, thin border, centered) and
+# the Summary header fill applied by ExcelComparator.format_excel_output
+STYLES_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<numFmts count="3">
+<numFmt numFmtId="164" formatCode="YYYY-MM-DD HH:MM:SS"/>
+<numFmt numFmtId="165" formatCode="YYYY-MM-DD"/>
+<numFmt numFmtId="166" formatCode="HH:MM:SS"/>
+</numFmts>
+<fonts count="3">
+<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>
+<font><b/><sz val="11"/><name val="Calibri"/><family val="2"/></font>
+<font><b/><sz val="11"/><color rgb="00FFFFFF"/><name val="Calibri"/><family val="2"/></font>
+</fonts>
+<fills count="3">
+<fill><patternFill/></fill>
+<fill><patternFill patternType="gray125"/></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="00366092"/><bgColor rgb="00366092"/></patternFill></fill>
+</fills>
+<borders count="2">
+<border><left/><right/><top/><bottom/><diagonal/></border>
+<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/><diagonal/></border>
+</borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="6">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1"><alignment horizontal="center" vertical="top"/></xf>
+<xf numFmtId="0" fontId="2" fillId="2" borderId="1" xfId="0" applyFont="1" applyFill="1" applyBorder="1" applyAlignment="1"><alignment horizontal="center" vertical="top"/></xf>
+<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="166" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>
+"""
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+# Characters that are not allowed in XML 1.0 documents
+ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _excel_serial(value):
+    """Convert a date/time value to an Excel serial number and style"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.replace(tzinfo=None)
+        return (value - EXCEL_EPOCH) / timedelta(days=1), STYLE_DATETIME
+    if isinstance(value, date):
+        return (datetime.combine(value, time()) - EXCEL_EPOCH) / timedelta(days=1), STYLE_DATE
+    seconds = value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1e6
+    return seconds / 86400, STYLE_TIME
+
+
+def _cell_xml(ref, value, style=STYLE_DEFAULT):
+    """Render one cell, or an empty string for missing values"""
+    if value is None or value is pd.NaT:
+        return ''
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return ''
+
+    style_attr = f' s="{style}"' if style else ''
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"{style_attr}><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"{style_attr}><v>{value!r}</v></c>'
+    if isinstance(value, (datetime, date, time)):
+        serial, date_style = _excel_serial(value)
+        return f'<c r="{ref}" s="{style or date_style}"><v>{serial!r}</v></c>'
+
+    text = ILLEGAL_XML_CHARS.sub('', str(value))
+    return (
+        f'<c r="{ref}" t="inlineStr"{style_attr}>'
+        f'<is><t xml:space="preserve">{escape(text)}</t></is></c>'
+    )
+
+
+def column_widths(df):
+    """Width per column as format_excel_output computes it for the Summary sheet"""
+    widths = []
+    for col in df.columns:
+        max_length = len(str(col))
+        for value in df[col]:
+            max_length = max(max_length, len(str(value)))
+        widths.append(min(max_length + 2, 50))
+    return widths
+
+
+def sheet_xml_chunks(columns, rows, header_style=STYLE_HEADER, widths=None, chunk_rows=1000):
+    """
+    Serialize rows to worksheet XML a block of rows at a time
+
+    Args:
+        columns (list): Header row values
+        rows (iterable): Row tuples in column order
+        header_style (int): Style index for the header row
+        widths (list): Column widths (optional)
+        chunk_rows (int): Rows per yielded chunk
+
+    Yields:
+        str: Consecutive pieces of the sheet XML
+    """
+    letters = [get_column_letter(i + 1) for i in range(len(columns))]
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+        f'<worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">',
+    ]
+
+    if widths:
+        parts.append('<cols>')
+        for i, width in enumerate(widths, start=1):
+            parts.append(f'<col min="{i}" max="{i}" width="{width}" customWidth="1"/>')
+        parts.append('</cols>')
+
+    parts.append('<sheetData>')
+    header_cells = ''.join(
+        _cell_xml(f'{letter}1', col, header_style) for letter, col in zip(letters, columns)
+    )
+    parts.append(f'<row r="1">{header_cells}</row>')
+
+    for row_number, row in enumerate(rows, start=2):
+        cells = ''.join(
+            _cell_xml(f'{letter}{row_number}', value) for letter, value in zip(letters, row)
+        )
+        parts.append(f'<row r="{row_number}">{cells}</row>')
+        if len(parts) >= chunk_rows:
+            yield ''.join(parts)
+            parts = []
+
+    parts.append('</sheetData></worksheet>')
+    yield ''.join(parts)
+
+
+def render_sheet(df, header_style=STYLE_HEADER, widths=None):
+    """
+    Serialize a DataFrame to worksheet XML
+
+    Strings are written inline so each sheet is self-contained and can be
+    rendered in a separate process without a shared strings table.
+
+    Args:
+        df (DataFrame): Data to write, header row first, no index
+        header_style (int): Style index for the header row
+        widths (list): Column widths (optional)
+
+    Returns:
+        bytes: UTF-8 encoded sheet XML
+    """
+    rows = df.itertuples(index=False, name=None)
+    return ''.join(sheet_xml_chunks(df.columns, rows, header_style, widths)).encode('utf-8')
+
+
+def _render_sheet_job(job):
+    name, df, styled = job
+    if styled:
+        return render_sheet(df, STYLE_SUMMARY_HEADER, column_widths(df))
+    return render_sheet(df)
+
+
+def assemble_workbook(output_path, sheets):
+    """
+    Write rendered sheet XML parts into an xlsx zip container
+
+    Args:
+        output_path (str): Path of the workbook to create
+        sheets (list): (sheet name, sheet XML) pairs in tab order; the XML is
+            either bytes or an iterable of str chunks that is streamed into
+            the archive
+    """
+    content_types = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">',
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>',
+        '<Default Extension="xml" ContentType="application/xml"/>',
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>',
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>',
+    ]
+    workbook = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+        f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>',
+    ]
+    workbook_rels = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+        f'<Relationships xmlns="{PKG_REL_NS}">',
+        f'<Relationship Id="rIdStyles" Target="styles.xml" Type="{REL_NS}/styles"/>',
+    ]
+
+    for i, (name, _) in enumerate(sheets, start=1):
+        content_types.append(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        )
+        workbook.append(f'<sheet name={quoteattr(name)} sheetId="{i}" r:id="rId{i}"/>')
+        workbook_rels.append(
+            f'<Relationship Id="rId{i}" Target="worksheets/sheet{i}.xml" Type="{REL_NS}/worksheet"/>'
+        )
+
+    content_types.append('</Types>')
+    workbook.append('</sheets></workbook>')
+    workbook_rels.append('</Relationships>')
+    root_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<Relationships xmlns="{PKG_REL_NS}">'
+        f'<Relationship Id="rId1" Target="xl/workbook.xml" Type="{REL_NS}/officeDocument"/>'
+        '</Relationships>'
+    )
+
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', ''.join(content_types))
+        zf.writestr('_rels/.rels', root_rels)
+        zf.writestr('xl/workbook.xml', ''.join(workbook))
+        zf.writestr('xl/_rels/workbook.xml.rels', ''.join(workbook_rels))
+        zf.writestr('xl/styles.xml', STYLES_XML)
+        for i, (_, xml) in enumerate(sheets, start=1):
+            if isinstance(xml, bytes):
+                zf.writestr(f'xl/worksheets/sheet{i}.xml', xml)
+                continue
+            with zf.open(f'xl/worksheets/sheet{i}.xml', 'w', force_zip64=True) as part:
+                for chunk in xml:
+                    part.write(chunk.encode('utf-8'))
+
+
+def _dedupe(sheets):
+    """Keep one entry per sheet name; later frames replace earlier ones in place"""
+    by_name = {}
+    for name, df, styled in sheets:
+        by_name[name] = (name, df, styled)
+    return list(by_name.values())
+
+
+def write_workbook(output_path, sheets, max_workers=None):
+    """
+    Render sheets concurrently and assemble them into one workbook
+
+    Sheets given as row sources instead of DataFrames (e.g. the spilled
+    results of the merge engine) are streamed straight into the archive in
+    this process, so they are never held in memory as a whole.
+
+    Args:
+        output_path (str): Path of the workbook to create
+        sheets (list): (sheet name, DataFrame or row source, styled) tuples in
+            tab order; styled sheets get the Summary header fill and column
+            widths. A row source has ``columns`` and iterates row tuples.
+        max_workers (int): Worker processes; 0 renders in this process
+    """
+    jobs = _dedupe(sheets)
+    frames = [job for job in jobs if isinstance(job[1], pd.DataFrame)]
+    if max_workers == 0 or len(frames) <= 1:
+        rendered = [_render_sheet_job(job) for job in frames]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            rendered = list(executor.map(_render_sheet_job, frames))
+    rendered = {name: xml for (name, _, _), xml in zip(frames, rendered)}
+
+    parts = []
+    for name, source, _ in jobs:
+        if name in rendered:
+            parts.append((name, rendered[name]))
+        else:
+            parts.append((name, sheet_xml_chunks(source.columns, source)))
+    assemble_workbook(output_path, parts)
+
+
+def _write_workbook_job(job):
+    output_path, sheets = job
+    write_workbook(output_path, sheets, max_workers=0)
+    return output_path
+
+
+def write_workbooks(workbooks, max_workers=None):
+    """
+    Write several workbooks in parallel, one worker process per workbook
+
+    Args:
+        workbooks (list): (output path, sheets) pairs as accepted by write_workbook
+        max_workers (int): Worker processes (optional)
+
+    Returns:
+        list: Paths of the written workbooks
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_write_workbook_job, workbooks))
@@ -0,0 +1,185 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Thread ids used in the trace file
+STAGES_TID = 1
+SAMPLES_TID = 2
+
+# tracemalloc is process-wide, so profilers running at the same time share
+# it: the first one to start it turns it on and the last one to stop turns
+# it off again, and peaks are folded into the spans of every active profiler
+# before they are reset
+_TRACE_LOCK = threading.RLock()
+_tracing_profilers = []
+_owns_tracemalloc = False
+
+
+class RunProfiler:
+    def __init__(self, sample_interval=0.005, trace_memory=True):
+        """
+        Profile one comparison run as a Chrome trace
+
+        Stages wrapped in ``span()`` become complete events with the traced
+        allocation size at their start and end and the peak reached inside
+        them. A background thread samples the profiled thread's call stack
+        every ``sample_interval`` seconds; consecutive samples are merged into
+        nested begin/end events, so the trace doubles as a flame chart in
+        chrome://tracing, Perfetto or speedscope.
+
+        tracemalloc is process-wide, so allocations made by other threads
+        running at the same time, including other profiled runs, are included
+        in the memory figures.
+
+        Args:
+            sample_interval (float): Seconds between stack samples
+            trace_memory (bool): Record allocation stats with tracemalloc
+        """
+        self.sample_interval = sample_interval
+        self.trace_memory = trace_memory
+        self.events = []
+        self._open_spans = []
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+        self._origin = None
+        self._thread_id = None
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def start(self):
+        """Start tracing allocations and sampling the calling thread"""
+        global _owns_tracemalloc
+        self._origin = time.perf_counter()
+        self._thread_id = threading.get_ident()
+        if self.trace_memory:
+            with _TRACE_LOCK:
+                if not _tracing_profilers and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _owns_tracemalloc = True
+                _tracing_profilers.append(self)
+
+        self._stop_sampling.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        """Stop sampling and allocation tracing"""
+        global _owns_tracemalloc
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            self._sampler.join()
+            self._sampler = None
+        with _TRACE_LOCK:
+            if self in _tracing_profilers:
+                _tracing_profilers.remove(self)
+                if not _tracing_profilers and _owns_tracemalloc:
+                    tracemalloc.stop()
+                    _owns_tracemalloc = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def _memory_checkpoint(self):
+        """Fold the peak since the last checkpoint into every open span"""
+        with _TRACE_LOCK:
+            if not tracemalloc.is_tracing():
+                return None
+            current, peak = tracemalloc.get_traced_memory()
+            profilers = _tracing_profilers if self in _tracing_profilers else _tracing_profilers + [self]
+            for profiler in profilers:
+                for span in profiler._open_spans:
+                    span['peak'] = max(span['peak'], peak)
+            tracemalloc.reset_peak()
+        self.events.append({
+            'name': 'traced memory', 'ph': 'C', 'pid': os.getpid(), 'tid': STAGES_TID,
+            'ts': self._now_us(), 'args': {'bytes': current},
+        })
+        return current
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Record a stage of the run
+
+        Args:
+            name (str): Stage name shown in the trace
+            **args: Extra values attached to the event (e.g. file name)
+        """
+        # Open and close the span under the lock so a checkpoint taken by
+        # another profiler in between cannot reset a peak it never saw
+        with _TRACE_LOCK:
+            current = self._memory_checkpoint()
+            span = {'start': self._now_us(), 'peak': current or 0}
+            self._open_spans.append(span)
+        try:
+            yield
+        finally:
+            with _TRACE_LOCK:
+                end_memory = self._memory_checkpoint()
+                self._open_spans.pop()
+            event_args = dict(args)
+            if current is not None:
+                event_args.update({
+                    'alloc_start_bytes': current,
+                    'alloc_end_bytes': end_memory,
+                    'alloc_peak_bytes': span['peak'],
+                })
+            self.events.append({
+                'name': name, 'cat': 'stage', 'ph': 'X', 'pid': os.getpid(), 'tid': STAGES_TID,
+                'ts': span['start'], 'dur': self._now_us() - span['start'], 'args': event_args,
+            })
+
+    def _sample_loop(self):
+        previous = []
+        own_file = os.path.abspath(__file__)
+        while not self._stop_sampling.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if os.path.abspath(code.co_filename) != own_file:
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stack.reverse()
+            self._emit_stack_change(previous, stack)
+            previous = stack
+        self._emit_stack_change(previous, [])
+
+    def _emit_stack_change(self, previous, stack):
+        ts = self._now_us()
+        common = 0
+        while common < min(len(previous), len(stack)) and previous[common] == stack[common]:
+            common += 1
+        for name, filename, line in reversed(previous[common:]):
+            self.events.append({
+                'name': name, 'ph': 'E', 'pid': os.getpid(), 'tid': SAMPLES_TID, 'ts': ts,
+            })
+        for name, filename, line in stack[common:]:
+            self.events.append({
+                'name': name, 'cat': 'sample', 'ph': 'B', 'pid': os.getpid(), 'tid': SAMPLES_TID,
+                'ts': ts, 'args': {'file': filename, 'line': line},
+            })
+
+    def write_trace(self, path):
+        """Write the collected events as a Chrome trace JSON file"""
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': STAGES_TID,
+             'args': {'name': 'stages'}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': SAMPLES_TID,
+             'args': {'name': f'sampled stacks ({self.sample_interval * 1000:g} ms)'}},
+        ]
+        # Viewers expect events in timestamp order per thread
+        events = sorted(self.events, key=lambda event: event['ts'])
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+        return path
@@ -0,0 +1,240 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prune_directory(root, max_age=None, max_bytes=None):
+    """
+    Remove entries directly under a directory by age and total size
+
+    Entries older than ``max_age`` seconds are removed first. If the remaining
+    entries still exceed ``max_bytes``, the least recently modified ones are
+    removed until the directory fits.
+
+    Args:
+        root (str): Directory to prune
+        max_age (float): Maximum entry age in seconds (optional)
+        max_bytes (int): Maximum total size in bytes (optional)
+
+    Returns:
+        list: Paths of the removed entries
+    """
+    root = Path(root)
+    if not root.is_dir():
+        return []
+
+    entries = []
+    for entry in root.iterdir():
+        # Dot-prefixed entries are in-progress writes
+        if entry.name.startswith('.'):
+            continue
+        try:
+            stat = entry.stat()
+            if entry.is_dir():
+                size = sum(p.stat().st_size for p in entry.rglob('*') if p.is_file())
+            else:
+                size = stat.st_size
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, size, entry))
+
+    now = time.time()
+    removed = []
+    kept = []
+    for mtime, size, entry in entries:
+        if max_age is not None and now - mtime > max_age:
+            removed.append(entry)
+        else:
+            kept.append((mtime, size, entry))
+
+    if max_bytes is not None:
+        kept.sort(key=lambda item: item[0])
+        total = sum(size for _, size, _ in kept)
+        while kept and total > max_bytes:
+            _, size, entry = kept.pop(0)
+            total -= size
+            removed.append(entry)
+
+    for entry in removed:
+        try:
+            if entry.is_dir():
+                shutil.rmtree(entry)
+            else:
+                entry.unlink()
+        except OSError:
+            pass
+
+    return removed
+
+
+class ResultCache:
+    def __init__(self, upload_folder, ttl_seconds=3600, max_bytes=512 * 1024 * 1024):
+        """
+        Cache comparison outputs keyed by input content and options
+
+        Uploads for each request go to their own job directory under
+        ``jobs/`` and finished workbooks are stored under ``results/``, so
+        concurrent requests never write to the same path.
+
+        Args:
+            upload_folder (str): Root folder for uploads and cached results
+            ttl_seconds (float): How long a cached result stays valid
+            max_bytes (int): Size budget for cached results
+        """
+        self.upload_folder = upload_folder
+        self.jobs_folder = os.path.join(upload_folder, 'jobs')
+        self.results_folder = os.path.join(upload_folder, 'results')
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+        os.makedirs(self.jobs_folder, exist_ok=True)
+        os.makedirs(self.results_folder, exist_ok=True)
+
+    def new_job_folder(self):
+        """Create a unique folder for one request's uploaded files"""
+        job_folder = os.path.join(self.jobs_folder, uuid.uuid4().hex)
+        os.makedirs(job_folder)
+        return job_folder
+
+    def make_key(self, base_path, comparison_paths, match_columns=None):
+        """
+        Build a cache key from the input files and comparison options
+
+        File names are part of the key because they become sheet names in
+        the exported workbook.
+        """
+        digest = hashlib.sha256()
+        for file_path in [base_path] + list(comparison_paths):
+            digest.update(Path(file_path).name.encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(file_digest(file_path).encode('ascii'))
+            digest.update(b'\0')
+        digest.update('\x1f'.join(match_columns or []).encode('utf-8'))
+        return digest.hexdigest()
+
+    def result_path(self, key):
+        return os.path.join(self.results_folder, f'{key}.xlsx')
+
+    def lookup(self, key):
+        """Return the cached result path for a key, or None if missing or expired"""
+        path = self.result_path(key)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        if time.time() - mtime > self.ttl_seconds:
+            return None
+        return path
+
+    @contextmanager
+    def _key_lock(self, key):
+        """
+        Hold an exclusive lock for one cache key
+
+        The lock is an flock on ``results/.{key}.lock`` so it also serializes
+        separate gunicorn worker processes. Platforms without fcntl fall back
+        to a lock shared by the threads of this process.
+        """
+        if fcntl is not None:
+            lock_path = os.path.join(self.results_folder, f'.{key}.lock')
+            with open(lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return
+
+        with self._lock:
+            key_lock, waiters = self._key_locks.get(key, (threading.Lock(), 0))
+            self._key_locks[key] = (key_lock, waiters + 1)
+        try:
+            with key_lock:
+                yield
+        finally:
+            with self._lock:
+                key_lock, waiters = self._key_locks[key]
+                if waiters == 1:
+                    del self._key_locks[key]
+                else:
+                    self._key_locks[key] = (key_lock, waiters - 1)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the result for a key, computing it at most once
+
+        Concurrent callers with the same key, in this or another process,
+        wait for the first one to finish and then share its output. The
+        result is returned as an open file so a later eviction cannot remove
+        it before the caller has sent it.
+
+        Args:
+            key (str): Cache key from ``make_key``
+            compute (callable): Writes the result to the given path and
+                returns True on success
+
+        Returns:
+            tuple: (open binary result file or None, True if served from cache)
+        """
+        with self._key_lock(key):
+            cached = self.lookup(key)
+            if cached:
+                try:
+                    result = open(cached, 'rb')
+                except FileNotFoundError:
+                    # Evicted between lookup and open; compute it again
+                    pass
+                else:
+                    # Refresh mtime so size-based eviction treats it as recently used
+                    os.utime(cached)
+                    return result, True
+
+            path = self.result_path(key)
+            tmp_path = os.path.join(self.results_folder, f'.{key}.{uuid.uuid4().hex}.xlsx')
+            try:
+                if not compute(tmp_path) or not os.path.exists(tmp_path):
+                    return None, False
+                result = open(tmp_path, 'rb')
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return result, False
+
+    def evict(self):
+        """Drop expired or excess results, stale job folders and old lock files"""
+        removed = prune_directory(self.results_folder, self.ttl_seconds, self.max_bytes)
+        removed += prune_directory(self.jobs_folder, self.ttl_seconds)
+
+        # Lock files are dot-prefixed, so prune_directory leaves them alone;
+        # only remove ones far older than any job could run
+        now = time.time()
+        for lock_path in Path(self.results_folder).glob('.*.lock'):
+            try:
+                if now - lock_path.stat().st_mtime > 2 * self.ttl_seconds:
+                    lock_path.unlink()
+                    removed.append(lock_path)
+            except OSError:
+                pass
+        return removed
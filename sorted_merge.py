@@ -0,0 +1,511 @@
+import heapq
+import itertools
+import math
+import os
+import pickle
+import random
+import re
+import tempfile
+import weakref
+from datetime import datetime
+from pathlib import Path
+
+import openpyxl
+import pandas as pd
+from openpyxl.cell.cell import ERROR_CODES
+
+try:
+    from pandas._libs.parsers import STR_NA_VALUES
+except ImportError:
+    STR_NA_VALUES = {
+        '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+        '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+    }
+
+# Text pandas.read_excel parses as numbers and booleans
+INT_STRING = re.compile(r'\s*[+-]?\d+\s*$')
+TRUE_STRINGS = {'True', 'TRUE', 'true'}
+FALSE_STRINGS = {'False', 'FALSE', 'false'}
+
+
+class UnsortedInputError(ValueError):
+    """Raised when a stream passed to merge_join is not sorted by its key"""
+
+    def __init__(self, side):
+        super().__init__(f"{side} input is not sorted by the match key")
+        self.side = side
+
+
+def read_rows(file_path):
+    """
+    Stream the first sheet of an Excel file row by row
+
+    ``.xlsx`` files are read with openpyxl in read-only mode so only one row
+    is held in memory at a time. Legacy ``.xls`` files cannot be streamed and
+    are loaded with pandas instead.
+
+    Returns:
+        tuple: (list of column names, iterator of row tuples)
+    """
+    if Path(file_path).suffix.lower() == '.xls':
+        df = pd.read_excel(file_path)
+        rows = (
+            tuple(None if _is_missing(v) else v for v in row)
+            for row in df.itertuples(index=False, name=None)
+        )
+        return list(df.columns), rows
+
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    ws = wb.worksheets[0]
+    row_iter = ws.iter_rows(values_only=True)
+    header_row = next(row_iter, None)
+    if header_row is None:
+        wb.close()
+        return [], iter(())
+
+    header = [
+        f'Unnamed: {i}' if value is None else value
+        for i, value in enumerate(header_row)
+    ]
+
+    def rows():
+        # Like pandas, keep blank rows between data rows but drop trailing ones
+        blank_rows = 0
+        try:
+            for row in row_iter:
+                if all(v is None for v in row):
+                    blank_rows += 1
+                    continue
+                for _ in range(blank_rows):
+                    yield (None,) * len(header)
+                blank_rows = 0
+                # Pad or trim ragged rows to the header width
+                row = tuple(row[:len(header)]) + (None,) * (len(header) - len(row))
+                yield row
+        finally:
+            wb.close()
+
+    return header, rows()
+
+
+def read_header(file_path):
+    """Return the column names of the first sheet without reading any data rows"""
+    if Path(file_path).suffix.lower() == '.xls':
+        return list(pd.read_excel(file_path, nrows=0).columns)
+
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        header_row = next(wb.worksheets[0].iter_rows(values_only=True), None)
+    finally:
+        wb.close()
+    if header_row is None:
+        return []
+    return [
+        f'Unnamed: {i}' if value is None else value
+        for i, value in enumerate(header_row)
+    ]
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _is_na(value):
+    """True for cells pandas.read_excel turns into NaN"""
+    if _is_missing(value):
+        return True
+    return isinstance(value, str) and (value in STR_NA_VALUES or value in ERROR_CODES)
+
+
+def _excel_cell(value):
+    """Convert a cell the way pandas' openpyxl reader does (integral floats become int)"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _parse_number(value):
+    """Return the number pandas would parse a cell as, or None if it is not numeric"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        if INT_STRING.match(value):
+            return int(value)
+        # float() also accepts forms pandas leaves as text
+        if '_' in value or 'nan' in value.lower():
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def infer_column_kinds(file_path):
+    """
+    Infer the dtype pandas.read_excel would give each column, in one pass
+
+    Only per-column flags are kept, so this streams like read_rows. The kinds
+    let the merge engine convert and clean rows exactly as the hash engine's
+    read_excel + clean_data would.
+
+    Returns:
+        list: 'int', 'float', 'bool', 'datetime' or 'object' per column
+    """
+    return _scan(file_path)[1]
+
+
+def sample_file(file_path, sample_size, seed=0):
+    """
+    Infer column kinds and draw a uniform row sample in one streaming pass
+
+    Rows are reservoir-sampled across the whole file rather than taken from
+    its head, so the sample of a file sorted by ID covers its full ID range.
+
+    Args:
+        file_path (str): Excel file to scan
+        sample_size (int): Rows to keep
+        seed (int): Seed for the sampler so runs are repeatable
+
+    Returns:
+        tuple: (column kinds, DataFrame of sampled rows cleaned like
+            clean_data, in file order, total number of data rows)
+    """
+    header, kinds, sample, total = _scan(file_path, sample_size, seed)
+    rows = [convert_row(row, kinds) for _, row in sorted(sample, key=lambda item: item[0])]
+    return kinds, pd.DataFrame(rows, columns=header), total
+
+
+def _scan(file_path, sample_size=0, seed=0):
+    header, rows = read_rows(file_path)
+    rng = random.Random(seed)
+    sample = []
+    total = 0
+    flags = [
+        {'values': False, 'na': False, 'numeric': True, 'int': True,
+         'bool': True, 'boolish': True, 'datetime': True}
+        for _ in header
+    ]
+
+    for row in rows:
+        if len(sample) < sample_size:
+            sample.append((total, row))
+        elif sample_size:
+            slot = rng.randrange(total + 1)
+            if slot < sample_size:
+                sample[slot] = (total, row)
+        total += 1
+
+        for value, flag in zip(row, flags):
+            if _is_na(value):
+                flag['na'] = True
+                continue
+            value = _excel_cell(value)
+            flag['values'] = True
+            if not isinstance(value, bool):
+                flag['bool'] = False
+                if value not in TRUE_STRINGS and value not in FALSE_STRINGS:
+                    flag['boolish'] = False
+            if not isinstance(value, datetime):
+                flag['datetime'] = False
+            number = _parse_number(value)
+            if number is None:
+                flag['numeric'] = False
+            elif isinstance(number, float):
+                flag['int'] = False
+
+    kinds = []
+    for flag in flags:
+        if not flag['values']:
+            kind = 'float'
+        elif flag['datetime']:
+            kind = 'datetime'
+        elif flag['bool']:
+            kind = 'float' if flag['na'] else 'bool'
+        elif flag['numeric']:
+            kind = 'int' if flag['int'] and not flag['na'] else 'float'
+        elif flag['boolish'] and not flag['na']:
+            kind = 'bool'
+        else:
+            kind = 'object'
+        kinds.append(kind)
+    return header, kinds, sample, total
+
+
+def convert_row(row, kinds):
+    """
+    Convert and clean a row as read_excel followed by clean_data would
+
+    Text (object) columns become stripped, upper-cased strings with empty
+    cells as 'NAN'; numeric columns hold numbers with NaN for empty cells.
+    """
+    return tuple(_convert_value(value, kind) for value, kind in zip(row, kinds))
+
+
+def _convert_value(value, kind):
+    if kind == 'object':
+        value = math.nan if _is_na(value) else _excel_cell(value)
+        return str(value).strip().upper()
+    if kind == 'datetime':
+        return pd.NaT if _is_na(value) else pd.Timestamp(value)
+    if _is_na(value):
+        return math.nan
+    if kind == 'bool':
+        return value if isinstance(value, bool) else value in TRUE_STRINGS
+    number = _parse_number(_excel_cell(value))
+    return int(number) if kind == 'int' else float(number)
+
+
+def _key_text(value, kind):
+    """Render a converted value as str() does inside a mixed-type composite key row"""
+    if kind == 'datetime':
+        return 'NaT' if value is pd.NaT else str(value)
+    return str(value)
+
+
+def _datetime_row_text(values):
+    """Render an all-datetime composite key row as Series.astype(str) does"""
+    present = [value for value in values if value is not pd.NaT]
+    if all(value == value.normalize() for value in present):
+        fmt = '%Y-%m-%d'
+    elif any(value.microsecond for value in present):
+        fmt = '%Y-%m-%d %H:%M:%S.%f'
+    else:
+        fmt = '%Y-%m-%d %H:%M:%S'
+    return ['NaT' if value is pd.NaT else value.strftime(fmt) for value in values]
+
+
+def key_function(header, match_cols, kinds):
+    """
+    Build a function that extracts the match key from a converted row
+
+    Keys follow ExcelComparator.compute_match_key. A single column keys on
+    its value, wrapped as a (type rank, value) pair so numbers sort
+    numerically and never get compared with strings; empty numeric or date
+    cells yield None and the row is skipped, like NaN keys in the hash
+    comparison. Several columns key on the same '|'-joined text the hash
+    engine builds, including the common row dtype pandas picks.
+    """
+    indices = [header.index(col) for col in match_cols]
+    col_kinds = [kinds[i] for i in indices]
+
+    if len(indices) == 1:
+        index, kind = indices[0], col_kinds[0]
+
+        def key(row):
+            value = row[index]
+            if kind == 'object':
+                return ((1, value),)
+            if _is_missing(value) or value is pd.NaT:
+                return None
+            if kind == 'datetime':
+                return ((2, value),)
+            # 3, 3.0 and True are one key in a hash set, so they must be here too
+            return ((0, _excel_cell(value) if isinstance(value, float) else int(value)),)
+
+        return key
+
+    kind_set = set(col_kinds)
+    if kind_set == {'int'}:
+        render = lambda values: [str(value) for value in values]
+    elif kind_set <= {'int', 'float'}:
+        render = lambda values: [str(float(value)) for value in values]
+    elif kind_set == {'bool'}:
+        render = lambda values: [str(value) for value in values]
+    elif kind_set == {'datetime'}:
+        render = _datetime_row_text
+    else:
+        render = lambda values: [_key_text(value, kind) for value, kind in zip(values, col_kinds)]
+
+    def key(row):
+        return ((1, '|'.join(render([row[i] for i in indices]))),)
+
+    return key
+
+
+def keyed_rows(rows, key):
+    """Pair each row with its key, dropping rows without a key"""
+    for row in rows:
+        row_key = key(row)
+        if row_key is not None:
+            yield row_key, row
+
+
+def external_sort(keyed, chunk_rows=100000, tmp_dir=None):
+    """
+    Sort (key, row) pairs that may not fit in memory
+
+    Pairs are buffered ``chunk_rows`` at a time, each buffer is sorted and
+    spilled to a temporary file, and the spilled runs are merged lazily.
+
+    Args:
+        keyed (iterable): (key, row) pairs in any order
+        chunk_rows (int): Rows held in memory before spilling to disk
+        tmp_dir (str): Directory for spill files (optional)
+    """
+    runs = []
+    try:
+        buffer = []
+        for item in keyed:
+            buffer.append(item)
+            if len(buffer) >= chunk_rows:
+                runs.append(_spill(buffer, tmp_dir))
+                buffer = []
+
+        buffer.sort(key=lambda item: item[0])
+        if not runs:
+            yield from buffer
+            return
+        if buffer:
+            runs.append(_spill(buffer, tmp_dir))
+            buffer = []
+
+        yield from heapq.merge(*(_read_run(run) for run in runs), key=lambda item: item[0])
+    finally:
+        for run in runs:
+            try:
+                os.remove(run)
+            except OSError:
+                pass
+
+
+def _spill(buffer, tmp_dir):
+    buffer.sort(key=lambda item: item[0])
+    fd, run_path = tempfile.mkstemp(prefix='merge_run_', suffix='.pkl', dir=tmp_dir)
+    with os.fdopen(fd, 'wb') as f:
+        for item in buffer:
+            pickle.dump(item, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return run_path
+
+
+def _read_run(run_path):
+    with open(run_path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SpilledRows:
+    """
+    Result rows written to a temporary file as they are produced
+
+    Takes the place of a result DataFrame for the merge engine so memory
+    stays bounded by the current key group: ``len()`` and ``empty`` work
+    like on a DataFrame, iterating reads the rows back from disk and
+    ``to_frame()`` loads them when a DataFrame is really needed. The file is
+    removed by ``cleanup()`` or when the object is garbage collected.
+    """
+
+    BATCH_ROWS = 1000
+
+    def __init__(self, columns, tmp_dir=None):
+        self.columns = list(columns)
+        fd, self.path = tempfile.mkstemp(prefix='merge_rows_', suffix='.pkl', dir=tmp_dir)
+        self._file = os.fdopen(fd, 'wb')
+        self._batch = []
+        self._rows = 0
+        self._finalizer = weakref.finalize(self, _remove_file, self.path)
+
+    def extend(self, rows):
+        for row in rows:
+            self._batch.append(row)
+            self._rows += 1
+            if len(self._batch) >= self.BATCH_ROWS:
+                self._flush()
+
+    def _flush(self):
+        if self._batch:
+            pickle.dump(self._batch, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+            self._batch = []
+
+    def close(self):
+        """Finish writing; called automatically before the rows are read"""
+        if self._file is not None:
+            self._flush()
+            self._file.close()
+            self._file = None
+
+    @property
+    def empty(self):
+        return self._rows == 0
+
+    def __len__(self):
+        return self._rows
+
+    def __iter__(self):
+        self.close()
+        for batch in _read_run(self.path):
+            yield from batch
+
+    def to_frame(self):
+        return pd.DataFrame(list(self), columns=self.columns)
+
+    def cleanup(self):
+        self.close()
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def __getstate__(self):
+        # Copies sent to export worker processes read the file but do not own it
+        self.close()
+        return {'columns': self.columns, 'path': self.path, '_rows': self._rows}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._file = None
+        self._batch = []
+        self._finalizer = None
+
+
+def _checked(keyed, side):
+    """Pass pairs through, raising UnsortedInputError if keys go backwards"""
+    previous = None
+    for item in keyed:
+        if previous is not None and item[0] < previous:
+            raise UnsortedInputError(side)
+        previous = item[0]
+        yield item
+
+
+def merge_join(base_keyed, comp_keyed):
+    """
+    Walk two key-sorted streams in a single pass
+
+    Only the rows sharing the current key are held in memory. Each distinct
+    key is emitted once as one of:
+
+    - ('matched', base_rows, comp_rows)
+    - ('missing', base_rows, [])
+    - ('extra', [], comp_rows)
+
+    Raises:
+        UnsortedInputError: If either stream is not sorted by key
+    """
+    base_groups = itertools.groupby(_checked(base_keyed, 'base'), key=lambda item: item[0])
+    comp_groups = itertools.groupby(_checked(comp_keyed, 'comparison'), key=lambda item: item[0])
+
+    base_group = next(base_groups, None)
+    comp_group = next(comp_groups, None)
+
+    while base_group is not None or comp_group is not None:
+        if comp_group is None or (base_group is not None and base_group[0] < comp_group[0]):
+            yield 'missing', [row for _, row in base_group[1]], []
+            base_group = next(base_groups, None)
+        elif base_group is None or comp_group[0] < base_group[0]:
+            yield 'extra', [], [row for _, row in comp_group[1]]
+            comp_group = next(comp_groups, None)
+        else:
+            yield 'matched', [row for _, row in base_group[1]], [row for _, row in comp_group[1]]
+            base_group = next(base_groups, None)
+            comp_group = next(comp_groups, None)
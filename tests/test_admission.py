@@ -0,0 +1,135 @@
+"""
+Tests for memory-guarded job admission
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import (
+    BYTES_PER_CELL, OPENPYXL_BYTES_PER_CELL, XLSX_EXPANSION, AdmissionController,
+    AdmissionRejected, estimate_job_memory, sniff_dimensions
+)
+
+
+def test_plan_switches_large_jobs_to_streaming():
+    controller = AdmissionController(1000, chunked_threshold=500)
+
+    assert controller.plan({'bytes': 400, 'chunked_bytes': 100}) == ('hash', 400)
+    assert controller.plan({'bytes': 600, 'chunked_bytes': 100}) == ('merge', 100)
+
+
+def test_plan_keeps_hash_engine_without_threshold():
+    controller = AdmissionController(1000)
+
+    assert controller.plan({'bytes': 900, 'chunked_bytes': 100}) == ('hash', 900)
+
+
+def test_rejects_job_larger_than_budget():
+    controller = AdmissionController(1000)
+    with pytest.raises(AdmissionRejected):
+        with controller.admit(1001):
+            pass
+
+
+def test_rejects_when_queue_is_full():
+    controller = AdmissionController(1000, max_queue=0)
+    with controller.admit(800):
+        with pytest.raises(AdmissionRejected):
+            with controller.admit(300):
+                pass
+    assert controller.status()['reserved_bytes'] == 0
+
+
+def test_queued_job_runs_after_release():
+    controller = AdmissionController(1000, max_queue=1, queue_timeout=5)
+    order = []
+
+    def waiter():
+        with controller.admit(300):
+            order.append('queued job')
+
+    with controller.admit(800):
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        while controller.status()['queue_depth'] == 0:
+            time.sleep(0.01)
+        order.append('first job')
+    thread.join()
+
+    assert order == ['first job', 'queued job']
+    assert controller.status()['active_jobs'] == 0
+
+
+def test_estimate_uses_sheet_dimensions(tmp_path):
+    pd = pytest.importorskip("pandas")
+    path = str(tmp_path / 'data.xlsx')
+    pd.DataFrame({'A': range(50), 'B': range(50)}).to_excel(path, index=False)
+
+    estimate = estimate_job_memory([path, path], chunk_rows=10)
+
+    floor = os.path.getsize(path) * XLSX_EXPANSION // BYTES_PER_CELL
+    assert estimate['cells'] == 2 * max(51 * 2, floor)
+    # Matched/missing/extra sheets hold base + comparison cells, all built in openpyxl
+    assert estimate['bytes'] >= 2 * 51 * 2 * OPENPYXL_BYTES_PER_CELL
+    assert estimate['chunked_bytes'] > 0
+
+
+def test_estimate_ignores_placeholder_dimension(tmp_path):
+    pd = pytest.importorskip("pandas")
+    import re
+    import zipfile
+    written = str(tmp_path / 'written.xlsx')
+    path = str(tmp_path / 'placeholder.xlsx')
+    pd.DataFrame({'A': range(5000), 'B': range(5000)}).to_excel(written, index=False)
+    with zipfile.ZipFile(written) as src, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            if item.filename == 'xl/worksheets/sheet1.xml':
+                data = re.sub(rb'<dimension ref="[^"]*" ?/>', b'<dimension ref="A1"/>', data)
+            dst.writestr(item, data)
+
+    assert sniff_dimensions(path) == (1, 1)
+    estimate = estimate_job_memory([path, path])
+
+    floor = os.path.getsize(path) * XLSX_EXPANSION // BYTES_PER_CELL
+    assert floor > 1
+    assert estimate['cells'] == 2 * floor
+    assert estimate['bytes'] >= 2 * floor * OPENPYXL_BYTES_PER_CELL
+
+
+def test_controllers_share_budget_through_state_file(tmp_path):
+    pytest.importorskip("fcntl")
+    # Two controllers on one ledger stand in for two gunicorn workers
+    state_path = str(tmp_path / '.admission.json')
+    first = AdmissionController(1000, state_path=state_path)
+    second = AdmissionController(1000, max_queue=0, state_path=state_path)
+
+    with first.admit(800):
+        assert second.status()['reserved_bytes'] == 800
+        with pytest.raises(AdmissionRejected):
+            with second.admit(300):
+                pass
+    with second.admit(300):
+        assert first.status()['active_jobs'] == 1
+    assert first.status()['reserved_bytes'] == 0
+
+
+def test_state_file_drops_jobs_of_dead_processes(tmp_path):
+    pytest.importorskip("fcntl")
+    import json
+    import subprocess
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    state_path = tmp_path / '.admission.json'
+    state_path.write_text(json.dumps({'jobs': {'stale': {'pid': process.pid, 'bytes': 900}}, 'queued': {}}))
+
+    controller = AdmissionController(1000, max_queue=0, state_path=str(state_path))
+
+    assert controller.status()['reserved_bytes'] == 0
+    with controller.admit(500):
+        pass
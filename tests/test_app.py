@@ -95,3 +95,89 @@ def test_basic_imports():
         assert numpy is not None
     except ImportError:
         pytest.skip("numpy not available")
+
+def _excel_bytes(df):
+    import io
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+@pytest.fixture
+def isolated_storage(tmp_path, monkeypatch):
+    """Point the app's caches and profile folder at a temporary directory."""
+    import app as app_module
+    from result_cache import ResultCache
+    from ingest_cache import IngestCache
+    from admission import AdmissionController
+    
+    monkeypatch.setattr(app_module, 'result_cache', ResultCache(str(tmp_path)))
+    monkeypatch.setattr(app_module, 'ingest_cache', IngestCache(str(tmp_path / 'ingest')))
+    profile_folder = tmp_path / 'profiles'
+    profile_folder.mkdir()
+    monkeypatch.setattr(app_module, 'PROFILE_FOLDER', str(profile_folder))
+    monkeypatch.setattr(app_module, 'admission', AdmissionController(
+        app_module.admission.budget_bytes, state_path=str(tmp_path / '.admission.json')
+    ))
+    return app_module
+
+def test_upload_repeated_request_uses_cached_result(client, isolated_storage):
+    """Test that an identical upload is served from the result cache"""
+    pd = pytest.importorskip("pandas")
+    app_module = isolated_storage
+    
+    import io
+    
+    # Workbooks embed a creation timestamp, so build the bytes once
+    base = _excel_bytes(pd.DataFrame({'EmployeeID': [1, 2, 3], 'Name': ['A', 'B', 'C']}))
+    comp = _excel_bytes(pd.DataFrame({'EmployeeID': [2, 3, 4], 'Name': ['B', 'C', 'D']}))
+    
+    def post():
+        return client.post('/upload', data={
+            'base_file': (io.BytesIO(base), 'base.xlsx'),
+            'comparison_files': [(io.BytesIO(comp), 'comp.xlsx')],
+            'match_columns': 'EmployeeID',
+        }, content_type='multipart/form-data')
+    
+    first = post()
+    assert first.status_code == 200
+    results_before = set(os.listdir(app_module.result_cache.results_folder))
+    
+    second = post()
+    assert second.status_code == 200
+    assert second.data == first.data
+    assert set(os.listdir(app_module.result_cache.results_folder)) == results_before
+    assert os.listdir(app_module.result_cache.jobs_folder) == []
+
+def test_status_endpoint(client, isolated_storage):
+    """Test that the status endpoint reports memory and queue usage"""
+    response = client.get('/status')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['queue_depth'] == 0
+    assert data['reserved_bytes'] == 0
+    assert 'rss_bytes' in data
+    assert 'available_bytes' in data
+
+def test_upload_with_profile_returns_trace(client, isolated_storage):
+    """Test that a profiled upload links to a Chrome trace file"""
+    pd = pytest.importorskip("pandas")
+    import io
+    
+    base = _excel_bytes(pd.DataFrame({'EmployeeID': [1, 2, 3]}))
+    comp = _excel_bytes(pd.DataFrame({'EmployeeID': [2, 3, 4]}))
+    
+    app.config['PROFILING_ENABLED'] = True
+    try:
+        response = client.post('/upload', data={
+            'base_file': (io.BytesIO(base), 'base.xlsx'),
+            'comparison_files': [(io.BytesIO(comp), 'comp.xlsx')],
+            'profile': '1',
+        }, content_type='multipart/form-data')
+    finally:
+        app.config['PROFILING_ENABLED'] = False
+    
+    assert response.status_code == 200
+    trace_url = response.headers['X-Profile-Trace']
+    trace = client.get(trace_url)
+    assert trace.status_code == 200
+    assert 'traceEvents' in trace.get_json()
@@ -0,0 +1,122 @@
+"""
+Tests for the columnar ingest cache
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+from excelExtractor import ExcelComparator
+from ingest_cache import IngestCache
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = str(tmp_path / 'region.xlsx')
+    pd.DataFrame({'EmployeeID': [1, 2, 3], 'Name': ['a', 'b', 'c']}).to_excel(path, index=False)
+    return path
+
+
+def test_second_read_uses_cached_frame(tmp_path, workbook, monkeypatch):
+    cache = IngestCache(str(tmp_path / 'cache'))
+    first = cache.read_excel(workbook)
+    assert cache.info()['workbooks'] == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("read_excel should not be called on a cache hit")
+
+    monkeypatch.setattr(pd, 'read_excel', fail)
+    second = cache.read_excel(workbook)
+
+    pd.testing.assert_frame_equal(first, second)
+    assert second.attrs['content_hash'] == first.attrs['content_hash']
+
+
+def test_cached_frame_cleans_like_read_excel(tmp_path):
+    path = str(tmp_path / 'gaps.xlsx')
+    pd.DataFrame({'EmployeeID': [1, 2, 3], 'Name': ['a', None, 'c']}).to_excel(path, index=False)
+    cache = IngestCache(str(tmp_path / 'cache'))
+    cache.read_excel(path)
+
+    comparator = ExcelComparator("dummy_path.xlsx")
+    cleaned = comparator.clean_data(cache.read_excel(path))
+
+    assert list(cleaned['Name']) == ['A', 'NAN', 'C']
+    pd.testing.assert_frame_equal(cleaned, comparator.clean_data(pd.read_excel(path)))
+
+
+def test_mixed_type_column_is_cached_and_restored(tmp_path, monkeypatch):
+    path = str(tmp_path / 'ids.xlsx')
+    pd.DataFrame({'ID': [123, 'A-12', None], 'Name': ['a', 'b', 'c']}).to_excel(path, index=False)
+    cache = IngestCache(str(tmp_path / 'cache'))
+    first = cache.read_excel(path)
+    assert cache.info()['workbooks'] == 1
+
+    monkeypatch.setattr(pd, 'read_excel', lambda *args, **kwargs: pytest.fail("cache was not used"))
+    second = cache.read_excel(path)
+
+    assert [type(value) for value in second['ID'][:2]] == [int, str]
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_uncacheable_workbook_is_marked_and_not_retried(tmp_path, monkeypatch):
+    path = str(tmp_path / 'numbered.xlsx')
+    pd.DataFrame({2024: [1, 2], 'Name': ['a', 'b']}).to_excel(path, index=False)
+    cache = IngestCache(str(tmp_path / 'cache'))
+    cache.read_excel(path)
+    assert cache.info()['skipped'] == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("conversion should not be retried")
+
+    monkeypatch.setattr(cache, '_write', fail)
+    assert list(cache.read_excel(path)[2024]) == [1, 2]
+
+
+def test_match_key_is_built_once(tmp_path, workbook):
+    cache = IngestCache(str(tmp_path / 'cache'))
+    content_hash = cache.read_excel(workbook).attrs['content_hash']
+    calls = []
+
+    def build():
+        calls.append(1)
+        return pd.Series(['1|A', '2|B', '3|C'])
+
+    first = cache.match_key(content_hash, ['EmployeeID', 'Name'], build)
+    second = cache.match_key(content_hash, ['EmployeeID', 'Name'], build)
+
+    assert list(first) == list(second)
+    assert len(calls) == 1
+    assert cache.info()['match_keys'] == 1
+
+
+def test_eviction_and_purge(tmp_path, workbook):
+    cache = IngestCache(str(tmp_path / 'cache'), max_bytes=0)
+    cache.read_excel(workbook)
+    assert cache.info()['workbooks'] == 0
+
+    cache.max_bytes = 1024 * 1024
+    cache.read_excel(workbook)
+    assert cache.info()['workbooks'] == 1
+    assert len(cache.purge()) == 1
+    assert cache.info()['total_bytes'] == 0
+
+
+def test_comparator_results_unchanged_with_cache(tmp_path, workbook):
+    base_path = str(tmp_path / 'base.xlsx')
+    pd.DataFrame({'EmployeeID': [2, 3, 4], 'Name': ['b', 'x', 'd']}).to_excel(base_path, index=False)
+
+    counts = []
+    for _ in range(2):
+        comparator = ExcelComparator(base_path, ingest_cache=IngestCache(str(tmp_path / 'cache')))
+        comparator.load_base_file()
+        comparator.compare_files([workbook], ['EmployeeID', 'Name'])
+        result = comparator.comparison_results['region.xlsx']
+        counts.append((result['matched_records'], result['missing_in_comparison'], result['extra_in_comparison']))
+
+    assert counts == [(1, 2, 2), (1, 2, 2)]
@@ -0,0 +1,130 @@
+"""
+Tests for automatic match key discovery
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pd = pytest.importorskip("pandas")
+
+from excelExtractor import ExcelComparator
+
+
+def _discover(base, comp):
+    comparator = ExcelComparator("dummy_path.xlsx")
+    base_clean = comparator.clean_data(pd.DataFrame(base))
+    comp_clean = comparator.clean_data(pd.DataFrame(comp))
+    common_cols = comparator.find_common_columns(base_clean, comp_clean)
+    return comparator.discover_key(base_clean, comp_clean, common_cols)
+
+
+def test_discovers_single_unique_column():
+    key, stats = _discover(
+        {'Dept': ['HR', 'HR', 'IT'], 'EmployeeID': [1, 2, 3], 'Salary': [10, 10, 20]},
+        {'Dept': ['HR', 'IT'], 'EmployeeID': [2, 3], 'Salary': [11, 20]},
+    )
+    assert key == ['EmployeeID']
+    assert stats['method'] == 'discovered'
+    assert stats['base_profile']['EmployeeID']['uniqueness'] == 1.0
+    assert stats['base_profile']['Dept']['cardinality'] == 2
+
+
+def test_discovers_composite_key():
+    key, stats = _discover(
+        {'Region': ['N', 'N', 'S', 'S'], 'Code': [1, 2, 1, 2], 'Note': ['x', 'x', 'y', 'y']},
+        {'Region': ['N', 'S'], 'Code': [1, 2], 'Note': ['x', 'y']},
+    )
+    assert sorted(key) == ['Code', 'Region']
+    assert stats['method'] == 'discovered'
+
+
+def test_skips_columns_with_nulls():
+    key, stats = _discover(
+        {'Email': ['a', None, 'c', None], 'EmployeeID': [1, 2, 3, 4]},
+        {'Email': ['a'], 'EmployeeID': [1]},
+    )
+    assert key == ['EmployeeID']
+    assert stats['base_profile']['Email']['null_rate'] == 0.5
+
+
+def test_prefers_overlapping_composite_key_over_unmatched_unique_column():
+    key, stats = _discover(
+        {'First': ['A', 'A', 'B'], 'Last': ['X', 'Y', 'X'], 'Salary': [10, 20, 30]},
+        {'First': ['A', 'B'], 'Last': ['Y', 'X'], 'Salary': [11, 31]},
+    )
+    assert sorted(key) == ['First', 'Last']
+    assert stats['overlap'] == 1.0
+    assert stats['checked_base_rows'] == 3
+
+
+def test_falls_back_to_all_common_columns():
+    key, stats = _discover(
+        {'Dept': ['HR', 'HR'], 'Name': ['A', 'A']},
+        {'Dept': ['HR'], 'Name': ['A']},
+    )
+    assert key == ['Dept', 'Name']
+    assert stats['method'] == 'fallback'
+
+
+def test_compare_files_records_key_discovery(tmp_path):
+    base_path = str(tmp_path / 'base.xlsx')
+    comp_path = str(tmp_path / 'comp.xlsx')
+    pd.DataFrame({'EmployeeID': [1, 2, 3], 'Salary': [10, 10, 20]}).to_excel(base_path, index=False)
+    pd.DataFrame({'EmployeeID': [2, 3, 4], 'Salary': [99, 20, 5]}).to_excel(comp_path, index=False)
+
+    comparator = ExcelComparator(base_path)
+    comparator.load_base_file()
+    comparator.compare_files([comp_path])
+
+    result = comparator.comparison_results['comp.xlsx']
+    assert result['match_columns'] == ['EmployeeID']
+    assert result['matched_records'] == 2
+    assert result['key_discovery']['method'] == 'discovered'
+
+
+def test_merge_engine_checks_discovered_key_on_whole_base(tmp_path, monkeypatch):
+    import excelExtractor
+    monkeypatch.setattr(excelExtractor, 'KEY_SAMPLE_SIZE', 3)
+    base_path = str(tmp_path / 'base.xlsx')
+    comp_path = str(tmp_path / 'comp.xlsx')
+    pd.DataFrame({'EmployeeID': [1, 2, 3, 1], 'Salary': [10, 10, 20, 30]}).to_excel(base_path, index=False)
+    pd.DataFrame({'EmployeeID': [1, 2], 'Salary': [10, 99]}).to_excel(comp_path, index=False)
+
+    comparator = ExcelComparator(base_path)
+    comparator.compare_files([comp_path], engine='merge')
+
+    stats = comparator.comparison_results['comp.xlsx']['key_discovery']
+    assert stats['sample_rows']['base'] == 3
+    assert stats['checked_base_rows'] == 4
+    assert stats['duplicate_base_keys'] == 1
+
+
+def test_merge_engine_discovers_key_outside_base_leading_rows(tmp_path):
+    base_path = str(tmp_path / 'base.xlsx')
+    comp_path = str(tmp_path / 'region.xlsx')
+    ids = list(range(1, 5001))
+    pd.DataFrame({
+        'EmployeeID': ids,
+        'Name': [f'Employee {i}' for i in ids],
+        'Dept': [['HR', 'IT', 'Ops'][i % 3] for i in ids],
+        'Salary': [1000 + i for i in ids],
+    }).to_excel(base_path, index=False)
+    region_ids = list(range(3001, 3501))
+    pd.DataFrame({
+        'EmployeeID': region_ids,
+        'Name': [f'Employee {i}' for i in region_ids],
+        'Dept': [['HR', 'IT', 'Ops'][i % 3] for i in region_ids],
+        'Salary': [5000 + i for i in region_ids],
+    }).to_excel(comp_path, index=False)
+
+    comparator = ExcelComparator(base_path)
+    comparator.compare_files([comp_path], engine='merge')
+
+    result = comparator.comparison_results['region.xlsx']
+    assert result['match_columns'] == ['EmployeeID']
+    assert result['key_discovery']['method'] == 'discovered'
+    assert result['matched_records'] == 500
+    assert result['extra_in_comparison'] == 0
@@ -0,0 +1,67 @@
+"""
+Tests for the parallel workbook export
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pd = pytest.importorskip("pandas")
+openpyxl = pytest.importorskip("openpyxl")
+
+from excelExtractor import ExcelComparator
+
+
+@pytest.fixture
+def comparator(tmp_path):
+    base_path = str(tmp_path / 'base.xlsx')
+    comp_path = str(tmp_path / 'region.xlsx')
+    pd.DataFrame({
+        'EmployeeID': [1, 2, 3, 4],
+        'Name': ['a', 'b <&>', 'c', None],
+        'Joined': pd.to_datetime(['2020-01-01', '2021-05-06', '2022-01-01', None]),
+        'Salary': [1.5, 2.0, 3.0, float('nan')],
+    }).to_excel(base_path, index=False)
+    pd.DataFrame({'EmployeeID': [2, 3, 5], 'Name': ['b', 'c', 'e']}).to_excel(comp_path, index=False)
+
+    comparator = ExcelComparator(base_path)
+    comparator.load_base_file()
+    comparator.compare_files([comp_path], ['EmployeeID'])
+    return comparator
+
+
+def _sheet_values(workbook):
+    return {
+        ws.title: [[cell.value for cell in row] for row in ws.iter_rows()]
+        for ws in workbook.worksheets
+    }
+
+
+def test_parallel_export_matches_sequential(comparator, tmp_path):
+    sequential_path = str(tmp_path / 'sequential.xlsx')
+    parallel_path = str(tmp_path / 'parallel.xlsx')
+    comparator.export_results(sequential_path)
+    comparator.export_results(parallel_path, parallel=True, max_workers=2)
+
+    sequential = openpyxl.load_workbook(sequential_path)
+    parallel = openpyxl.load_workbook(parallel_path)
+
+    assert parallel.sheetnames == sequential.sheetnames
+    assert _sheet_values(parallel) == _sheet_values(sequential)
+
+    expected, actual = sequential['Summary'], parallel['Summary']
+    assert actual['A1'].fill.fgColor.rgb == expected['A1'].fill.fgColor.rgb
+    assert actual['A1'].font.color.rgb == expected['A1'].font.color.rgb
+    for letter in 'ABCDEFGH':
+        assert actual.column_dimensions[letter].width == expected.column_dimensions[letter].width
+
+
+def test_export_results_per_file(comparator, tmp_path):
+    paths = comparator.export_results_per_file(str(tmp_path / 'split'), max_workers=2)
+
+    assert [os.path.basename(p) for p in paths] == ['region_comparison.xlsx']
+    workbook = openpyxl.load_workbook(paths[0])
+    assert workbook.sheetnames == ['Summary', 'region_Matched', 'region_Missing', 'region_Extra']
+    assert workbook['Summary']['A2'].value == 'region.xlsx'
@@ -0,0 +1,92 @@
+"""
+Tests for run profiling and trace output
+"""
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profiling import RunProfiler
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    data = []
+    while time.perf_counter() < end:
+        data.append('x' * 100)
+    return data
+
+
+def test_trace_contains_spans_samples_and_memory(tmp_path):
+    profiler = RunProfiler(sample_interval=0.001)
+    with profiler:
+        with profiler.span('outer', file='a.xlsx'):
+            with profiler.span('inner'):
+                _busy(0.05)
+
+    trace_path = profiler.write_trace(str(tmp_path / 'trace.json'))
+    with open(trace_path) as f:
+        events = json.load(f)['traceEvents']
+
+    spans = {e['name']: e for e in events if e['ph'] == 'X'}
+    assert set(spans) == {'outer', 'inner'}
+    assert spans['outer']['args']['file'] == 'a.xlsx'
+    assert spans['outer']['dur'] >= spans['inner']['dur'] > 0
+    assert spans['outer']['args']['alloc_peak_bytes'] >= spans['inner']['args']['alloc_peak_bytes'] > 0
+
+    begins = [e for e in events if e['ph'] == 'B']
+    ends = [e for e in events if e['ph'] == 'E']
+    assert begins and len(begins) == len(ends)
+    assert any(e['name'] == '_busy' for e in begins)
+
+
+def test_overlapping_profilers_share_tracemalloc():
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        pytest.skip("tracemalloc was started outside the profilers")
+    first = RunProfiler()
+    second = RunProfiler()
+    first.start()
+    second.start()
+    with second.span('outer'):
+        with first.span('other run'):
+            peak_data = _busy(0.02)
+            del peak_data
+        first.stop()
+
+        assert tracemalloc.is_tracing()
+        with second.span('after first stopped'):
+            _busy(0.01)
+    second.stop()
+
+    assert not tracemalloc.is_tracing()
+    spans = {e['name']: e['args'] for e in second.events if e['ph'] == 'X'}
+    assert spans['after first stopped']['alloc_end_bytes'] is not None
+    # The first profiler's checkpoints reset the shared peak, but not before
+    # folding it into the second profiler's open span
+    other = [e['args'] for e in first.events if e['ph'] == 'X'][0]
+    assert spans['outer']['alloc_peak_bytes'] >= other['alloc_peak_bytes']
+
+
+def test_comparator_stages_are_traced(tmp_path):
+    pd = pytest.importorskip("pandas")
+    from excelExtractor import ExcelComparator
+
+    base_path = str(tmp_path / 'base.xlsx')
+    comp_path = str(tmp_path / 'comp.xlsx')
+    pd.DataFrame({'EmployeeID': [1, 2, 3]}).to_excel(base_path, index=False)
+    pd.DataFrame({'EmployeeID': [2, 3, 4]}).to_excel(comp_path, index=False)
+
+    comparator = ExcelComparator(base_path)
+    comparator.profiler = RunProfiler()
+    with comparator.profiler:
+        comparator.load_base_file()
+        comparator.compare_files([comp_path], ['EmployeeID'])
+
+    names = [e['name'] for e in comparator.profiler.events if e['ph'] == 'X']
+    for stage in ['load base file', 'compare comp.xlsx', 'read', 'build match keys', 'set operations']:
+        assert stage in names
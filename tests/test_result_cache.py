@@ -0,0 +1,137 @@
+"""
+Tests for the comparison result cache
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_cache import ResultCache, prune_directory
+
+
+def _write(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    return str(path)
+
+
+def test_key_depends_on_content_and_options(tmp_path):
+    cache = ResultCache(str(tmp_path / 'uploads'))
+    base = _write(tmp_path / 'base.xlsx', b'base')
+    comp = _write(tmp_path / 'comp.xlsx', b'comp')
+
+    key = cache.make_key(base, [comp], ['EmployeeID'])
+    assert key == cache.make_key(base, [comp], ['EmployeeID'])
+    assert key != cache.make_key(base, [comp], None)
+
+    _write(tmp_path / 'comp.xlsx', b'changed')
+    assert key != cache.make_key(base, [comp], ['EmployeeID'])
+
+
+def test_get_or_compute_serves_from_cache(tmp_path):
+    cache = ResultCache(str(tmp_path / 'uploads'))
+    calls = []
+
+    def compute(output_path):
+        calls.append(output_path)
+        _write(output_path, b'result')
+        return True
+
+    result, cached = cache.get_or_compute('abc', compute)
+    assert not cached
+    result_again, cached = cache.get_or_compute('abc', compute)
+    assert cached
+    assert result.read() == result_again.read() == b'result'
+    assert len(calls) == 1
+    result.close()
+    result_again.close()
+
+
+def test_concurrent_identical_requests_compute_once(tmp_path):
+    cache = ResultCache(str(tmp_path / 'uploads'))
+    calls = []
+
+    def compute(output_path):
+        calls.append(output_path)
+        time.sleep(0.1)
+        _write(output_path, b'result')
+        return True
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute('abc', compute)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert {result.read() for result, _ in results} == {b'result'}
+    for result, _ in results:
+        result.close()
+
+
+def test_separate_caches_share_one_computation(tmp_path):
+    pytest.importorskip("fcntl")
+    # Two instances on one folder stand in for two gunicorn workers
+    caches = [ResultCache(str(tmp_path / 'uploads')) for _ in range(2)]
+    calls = []
+
+    def compute(output_path):
+        calls.append(output_path)
+        time.sleep(0.1)
+        _write(output_path, b'result')
+        return True
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda cache=cache: results.append(cache.get_or_compute('abc', compute)))
+        for cache in caches
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(cached for _, cached in results) == [False, True]
+    for result, _ in results:
+        result.close()
+
+
+def test_evicted_result_stays_readable_once_returned(tmp_path):
+    cache = ResultCache(str(tmp_path / 'uploads'), max_bytes=0)
+    result, _ = cache.get_or_compute('abc', lambda output_path: bool(_write(output_path, b'result')))
+
+    cache.evict()
+
+    assert cache.lookup('abc') is None
+    assert result.read() == b'result'
+    result.close()
+
+
+def test_failed_compute_is_not_cached(tmp_path):
+    cache = ResultCache(str(tmp_path / 'uploads'))
+    result, cached = cache.get_or_compute('abc', lambda output_path: False)
+    assert result is None
+    assert cache.lookup('abc') is None
+
+
+def test_prune_directory_by_age_and_size(tmp_path):
+    old = _write(tmp_path / 'old.xlsx', b'x' * 10)
+    older = time.time() - 100
+    os.utime(old, (older, older))
+    _write(tmp_path / 'a.xlsx', b'x' * 10)
+    _write(tmp_path / 'b.xlsx', b'x' * 10)
+    os.utime(tmp_path / 'a.xlsx', (older + 50, older + 50))
+
+    removed = prune_directory(str(tmp_path), max_age=60, max_bytes=15)
+
+    assert sorted(p.name for p in removed) == ['a.xlsx', 'old.xlsx']
+    assert os.listdir(tmp_path) == ['b.xlsx']
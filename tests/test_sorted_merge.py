@@ -0,0 +1,105 @@
+"""
+Tests for the sorted merge-join comparison engine
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pd = pytest.importorskip("pandas")
+
+from excelExtractor import ExcelComparator
+from sorted_merge import SpilledRows, UnsortedInputError, external_sort, merge_join
+
+
+def _keyed(keys):
+    return [(((0, k),), (k,)) for k in keys]
+
+
+def test_merge_join_groups_keys():
+    events = list(merge_join(iter(_keyed([1, 2, 2, 4])), iter(_keyed([2, 3, 4]))))
+
+    assert [status for status, _, _ in events] == ['missing', 'matched', 'extra', 'matched']
+    assert events[1][1] == [(2,), (2,)]
+    assert events[1][2] == [(2,)]
+
+
+def test_merge_join_rejects_unsorted_input():
+    with pytest.raises(UnsortedInputError) as excinfo:
+        list(merge_join(iter(_keyed([2, 1])), iter(_keyed([1, 2]))))
+    assert excinfo.value.side == 'base'
+
+
+def test_external_sort_spills_and_merges(tmp_path):
+    keys = [5, 3, 9, 1, 7, 2, 8, 4, 6]
+    result = list(external_sort(iter(_keyed(keys)), chunk_rows=2, tmp_dir=str(tmp_path)))
+
+    assert [row[0] for _, row in result] == sorted(keys)
+    assert os.listdir(tmp_path) == []
+
+
+def _sorted_rows(df):
+    """Result rows as comparable plain values, NaN as None, in a stable order"""
+    values = df.astype(object).where(df.notna(), None).values.tolist()
+    return sorted((tuple(row) for row in values), key=repr)
+
+
+@pytest.mark.parametrize("base, comp, match_cols", [
+    ({'EmployeeID': [1, 2, 3, 4], 'Name': ['a ', 'B', 'c', 'D']},
+     {'EmployeeID': [2, 3, 4, 5], 'Name': ['x'] * 4}, ['EmployeeID']),
+    ({'EmployeeID': [1, 2, 3, 4], 'Name': ['a ', 'B', 'c', 'D']},
+     {'EmployeeID': [5, 3, 4, 2], 'Name': ['x'] * 4}, ['EmployeeID']),
+    # Mixed number/text columns are stringified by clean_data, so 3 and '3' match
+    ({'Code': ['1', '3', 'x', 4], 'Name': ['a', None, 'c', 'd']},
+     {'Code': ['2', '3', 3, 'z'], 'Name': ['b', 'c', None, 'e']}, ['Code']),
+    ({'Region': ['N', 'S', 'N', None], 'Code': [1, 2, 3, 4]},
+     {'Region': ['N', 'S', None, 's'], 'Code': [1.0, 2.5, 4, 2]}, ['Region', 'Code']),
+])
+def test_merge_engine_matches_hash_engine(tmp_path, base, comp, match_cols):
+    base_path = str(tmp_path / 'base.xlsx')
+    comp_path = str(tmp_path / 'comp.xlsx')
+    pd.DataFrame(base).to_excel(base_path, index=False)
+    pd.DataFrame(comp).to_excel(comp_path, index=False)
+
+    hash_comparator = ExcelComparator(base_path)
+    hash_comparator.load_base_file()
+    hash_comparator.compare_files([comp_path], match_cols)
+
+    merge_comparator = ExcelComparator(base_path)
+    merge_comparator.compare_files([comp_path], match_cols, engine='merge', chunk_rows=2)
+
+    expected = hash_comparator.comparison_results['comp.xlsx']
+    actual = merge_comparator.comparison_results['comp.xlsx']
+    for field in ['total_base_records', 'total_comp_records', 'matched_records',
+                  'missing_in_comparison', 'extra_in_comparison']:
+        assert actual[field] == expected[field]
+    for field in ['matched_data_base', 'matched_data_comp', 'missing_records', 'extra_records']:
+        assert _sorted_rows(actual[field].to_frame()) == _sorted_rows(expected[field])
+
+
+def test_merge_results_are_spilled_and_streamed_to_export(tmp_path):
+    base_path = str(tmp_path / 'base.xlsx')
+    comp_path = str(tmp_path / 'comp.xlsx')
+    pd.DataFrame({'EmployeeID': range(1, 2501), 'Name': ['n'] * 2500}).to_excel(base_path, index=False)
+    pd.DataFrame({'EmployeeID': range(2001, 3001), 'Name': ['m'] * 1000}).to_excel(comp_path, index=False)
+
+    comparator = ExcelComparator(base_path)
+    comparator.compare_files([comp_path], ['EmployeeID'], engine='merge')
+    result = comparator.comparison_results['comp.xlsx']
+
+    missing = result['missing_records']
+    assert isinstance(missing, SpilledRows)
+    assert len(missing) == 2000
+    assert os.path.exists(missing.path)
+
+    output_path = str(tmp_path / 'out.xlsx')
+    comparator.export_results(output_path)
+    sheets = pd.read_excel(output_path, sheet_name=None)
+    assert list(sheets) == ['Summary', 'comp_Matched', 'comp_Missing', 'comp_Extra']
+    assert list(sheets['comp_Missing']['EmployeeID']) == list(range(1, 2001))
+    assert len(sheets['comp_Extra']) == 500
+
+    missing.cleanup()
+    assert not os.path.exists(missing.path)